@@ -0,0 +1,78 @@
+"""
+Shared setup for the benchmarks.
+
+Run a benchmark from the game directory with the game's virtualenv
+active, e.g. `python benchmarks/page_history.py`. Benchmarks that need
+the database work on a throwaway test database created for the run,
+never on the game's own.
+
+"""
+import os
+import sys
+import timeit
+
+GAME_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def setup_django():
+    """
+    Load the game's settings and Evennia, without a database.
+    """
+    if GAME_DIR not in sys.path:
+        sys.path.insert(0, GAME_DIR)
+    os.environ.setdefault("DJANGO_SETTINGS_MODULE", "server.conf.settings")
+    import django
+    django.setup()
+    import evennia
+    evennia._init()
+
+
+def setup_database():
+    """
+    Load the game's settings and Evennia, and switch to a new test database.
+
+    Returns:
+        name (str): The name of the game's database, for `teardown_database`.
+    """
+    setup_django()
+    from django.db import connection
+    name = connection.settings_dict["NAME"]
+    connection.creation.create_test_db(verbosity=0, autoclobber=True)
+    return name
+
+
+def teardown_database(name):
+    """
+    Throw away the test database.
+    """
+    from django.db import connection
+    connection.creation.destroy_test_db(name, verbosity=0)
+
+
+def timed(func, repeat=100):
+    """
+    Run a function a number of times.
+
+    Returns:
+        ms (float): The mean time per call, in milliseconds.
+    """
+    start = timeit.default_timer()
+    for _ in range(repeat):
+        func()
+    return (timeit.default_timer() - start) * 1000.0 / repeat
+
+
+def explain(queryset):
+    """
+    Get the database's query plan for a queryset.
+    """
+    from django.db import connection
+    sql, params = queryset.query.sql_with_params()
+    prefix = "EXPLAIN QUERY PLAN " if connection.vendor == "sqlite" else "EXPLAIN "
+    with connection.cursor() as cursor:
+        cursor.execute(prefix + sql, params)
+        return "\n".join("    " + " ".join(str(column) for column in row) for row in cursor.fetchall())
+
+
+def report(name, ms, baseline=None):
+    print("%-40s %10.3f ms%s" % (name, ms, "  (%.1fx)" % (baseline / ms) if baseline and ms else ""))
@@ -0,0 +1,75 @@
+"""
+Command parser benchmark (server/conf/cmdparser.py)
+
+Merges the game's character and account cmdsets, generates random
+input (command names and aliases with arguments, ignored prefixes,
+`name-2` multimatch references, misspellings and plain chatter), runs it
+through Evennia's default `cmdparser` and the trie-backed one, checks
+that they find the same matches, and times them.
+
+    python benchmarks/cmdparser.py [--inputs 100000]
+
+"""
+import argparse
+import os
+import random
+import string
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from _setup import report, setup_django, timed
+
+ARGS = ("", " here", " me = hello there", "/switch foo", " 2", ":waves", " =", "  spaced  ")
+
+
+def inputs(cmdset, number):
+    names = [name for cmd in cmdset.commands for name in [cmd.key] + list(cmd.aliases) if name]
+    words = ["".join(random.choice(string.ascii_lowercase) for _ in range(random.randint(1, 8)))
+             for _ in range(200)]
+    result = []
+    for _ in range(number):
+        kind = random.random()
+        if kind < 0.6:
+            text = random.choice(names)
+            if random.random() < 0.2:
+                text = text[:max(1, len(text) - 1)]
+            if random.random() < 0.1:
+                text = "@" + text
+            if random.random() < 0.05:
+                text += "-%i" % random.randint(1, 3)
+        else:
+            text = random.choice(words)
+        result.append(text + random.choice(ARGS))
+    return result
+
+
+def summary(matches):
+    return [(match[0], match[1], match[2].key) for match in matches]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().split("\n")[0])
+    parser.add_argument("--inputs", type=int, default=100000)
+    args = parser.parse_args()
+
+    setup_django()
+    from evennia.commands import cmdparser as default_parser
+    from commands.default_cmdsets import AccountCmdSet, CharacterCmdSet
+    from server.conf import cmdparser as trie_parser
+
+    cmdset = CharacterCmdSet() + AccountCmdSet()
+    texts = inputs(cmdset, args.inputs)
+    mismatches = [text for text in texts if summary(default_parser.cmdparser(text, cmdset, None)) !=
+                  summary(trie_parser.cmdparser(text, cmdset, None))]
+    print("%i commands, %i inputs, %i with different matches"
+          % (len(cmdset.commands), len(texts), len(mismatches)))
+    for text in mismatches[:10]:
+        print("  %r" % text)
+
+    before = timed(lambda: [default_parser.cmdparser(text, cmdset, None) for text in texts], 3)
+    report("default cmdparser", before)
+    report("trie cmdparser", timed(lambda: [trie_parser.cmdparser(text, cmdset, None) for text in texts], 3), before)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,76 @@
+"""
+Merged cmdset cache benchmark (world/cmdsetcache.py)
+
+Builds a room with `--exits` exits and `--objects` other objects in a
+test database, puts a character with an account in it, and times for
+that caller:
+
+- Evennia's `get_and_merge_cmdsets`, as run for every command before;
+- building the cache key alone (`cmdsetcache.signature`);
+- the cached `get_and_merge_cmdsets` on a cache hit, key included.
+
+    python benchmarks/cmdset_merge.py [--exits 20] [--objects 100]
+
+"""
+import argparse
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from _setup import report, setup_database, teardown_database, timed
+
+
+def merged(deferred):
+    result = []
+    deferred.addCallback(result.append)
+    return result[0]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().split("\n")[0])
+    parser.add_argument("--exits", type=int, default=20)
+    parser.add_argument("--objects", type=int, default=100)
+    parser.add_argument("--repeat", type=int, default=200)
+    args = parser.parse_args()
+
+    name = setup_database()
+    try:
+        from django.conf import settings
+        from evennia.commands import cmdhandler
+        from evennia.utils import create
+        from world import cmdsetcache
+
+        room = create.create_object(settings.BASE_ROOM_TYPECLASS, key="Bench room")
+        other = create.create_object(settings.BASE_ROOM_TYPECLASS, key="Elsewhere")
+        for num in range(args.exits):
+            create.create_object(settings.BASE_EXIT_TYPECLASS, key="exit%i" % num, location=room,
+                                 destination=other)
+        for num in range(args.objects):
+            create.create_object(settings.BASE_OBJECT_TYPECLASS, key="thing%i" % num, location=room)
+        account = create.create_account("benchmarker", None, "benchmark password")
+        character = create.create_object(settings.BASE_CHARACTER_TYPECLASS, key="Benchmarker", location=room)
+        character.account = account
+
+        original = cmdhandler.get_and_merge_cmdsets
+        cmdsetcache.install()
+        call = (account, None, account, character, "account", "look")
+        key, _ = cmdsetcache.signature(*call[:5])
+        print("room of %i objects; cacheable: %s" % (len(room.contents), key is not None))
+
+        expected = merged(original(*call))
+        merged(cmdhandler.get_and_merge_cmdsets(*call))
+        cached = merged(cmdhandler.get_and_merge_cmdsets(*call))
+        print("cached cmdset has the same commands: %s"
+              % (sorted(cmd.key for cmd in expected.commands) == sorted(cmd.key for cmd in cached.commands)))
+
+        before = timed(lambda: merged(original(*call)), args.repeat)
+        report("get_and_merge_cmdsets", before)
+        report("cache key only", timed(lambda: cmdsetcache.signature(*call[:5]), args.repeat), before)
+        report("cached, on a hit", timed(lambda: merged(cmdhandler.get_and_merge_cmdsets(*call)), args.repeat),
+               before)
+    finally:
+        teardown_database(name)
+
+
+if __name__ == "__main__":
+    main()
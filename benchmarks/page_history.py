@@ -0,0 +1,100 @@
+"""
+Page history benchmark (world/pages/history.py)
+
+Fills a test database with pages between BACKGROUND_ACCOUNTS accounts,
+one heavy account sending and receiving `--heavy` pages, and one light
+account with `--light` pages, then shows the query plans and timings of
+`latest_pages` next to the single "sent or received" query it replaced.
+
+    python benchmarks/page_history.py [--heavy 100000] [--light 20] [--background 100000]
+
+"""
+import argparse
+import os
+import random
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from _setup import explain, report, setup_database, teardown_database, timed
+
+BACKGROUND_ACCOUNTS = 200
+BATCH_SIZE = 5000
+
+
+def populate(heavy, light, background):
+    from django.conf import settings
+    from evennia.accounts.models import AccountDB
+    from evennia.comms.models import Msg
+    senders = Msg.db_sender_accounts.through
+    receivers = Msg.db_receivers_accounts.through
+
+    AccountDB.objects.bulk_create([AccountDB(username="bench%i" % num,
+                                             db_typeclass_path=settings.BASE_ACCOUNT_TYPECLASS)
+                                   for num in range(BACKGROUND_ACCOUNTS + 2)])
+    ids = list(AccountDB.objects.filter(username__startswith="bench").order_by("id").values_list("id", flat=True))
+    heavy_id, light_id, others = ids[0], ids[1], ids[2:]
+
+    # pages of the heavy and light accounts are spread among the others
+    owners = [heavy_id] * heavy + [light_id] * light + [None] * background
+    random.shuffle(owners)
+    msg_id = 0
+    for start in range(0, len(owners), BATCH_SIZE):
+        batch = owners[start:start + BATCH_SIZE]
+        msgs, sent, received = [], [], []
+        for owner in batch:
+            msg_id += 1
+            sender, receiver = random.sample(others, 2)
+            if owner and random.random() < 0.5:
+                sender = owner
+            elif owner:
+                receiver = owner
+            msgs.append(Msg(id=msg_id, db_message="page %i" % msg_id))
+            sent.append(senders(msg_id=msg_id, accountdb_id=sender))
+            received.append(receivers(msg_id=msg_id, accountdb_id=receiver))
+        Msg.objects.bulk_create(msgs)
+        senders.objects.bulk_create(sent)
+        receivers.objects.bulk_create(received)
+    return AccountDB.objects.get(id=heavy_id), AccountDB.objects.get(id=light_id)
+
+
+def combined_queryset(account):
+    """
+    The single query `latest_pages` used before.
+    """
+    from django.db.models import Q
+    from evennia.comms.models import Msg
+    sent = Msg.db_sender_accounts.through.objects.filter(accountdb=account).values("msg_id")
+    received = Msg.db_receivers_accounts.through.objects.filter(accountdb=account).values("msg_id")
+    return Msg.objects.filter(Q(id__in=sent) | Q(id__in=received), db_receivers_channels__isnull=True) \
+                      .exclude(db_hide_from_accounts=account) \
+                      .order_by("-db_date_created", "-id")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().split("\n")[0])
+    parser.add_argument("--heavy", type=int, default=100000)
+    parser.add_argument("--light", type=int, default=20)
+    parser.add_argument("--background", type=int, default=100000)
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    name = setup_database()
+    try:
+        from world.pages import history
+        history.ensure_indexes()
+        heavy, light = populate(args.heavy, args.light, args.background)
+        number = history.DEFAULT_PAGE_COUNT
+        for label, account in (("heavy", heavy), ("light", light)):
+            print("\n%s account:" % label)
+            print("  combined query plan:\n%s" % explain(combined_queryset(account)[:number + 1]))
+            print("  sent query plan:\n%s" % explain(history.sent_queryset(account)[:number + 1]))
+            print("  received query plan:\n%s" % explain(history.received_queryset(account)[:number + 1]))
+            before = timed(lambda: list(combined_queryset(account)[:number + 1]), args.repeat)
+            report("  combined query", before)
+            report("  latest_pages", timed(lambda: history.latest_pages(account, number), args.repeat), before)
+    finally:
+        teardown_database(name)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,100 @@
+"""
+Inline pose parser benchmark (InlinePoseParser in commands/default/comms.py)
+
+Parses random page/whisper messages with `InlinePoseParser` and with the
+`InlinePoseHelper` it replaced (copied below), checks that both give the
+same text, and times them.
+
+    python benchmarks/pose_parser.py [--messages 100000]
+
+"""
+import argparse
+import os
+import random
+import string
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from _setup import report, setup_django, timed
+
+PREFIXES = ("", "", "", ":", ";", "'", ",", "\\\\", "\\")
+
+
+class InlinePoseHelper(object):
+    """
+    The parser used before, as it was.
+    """
+    @staticmethod
+    def parse(raw_pose=None):
+        cmd = raw_pose[:1]
+        body = raw_pose
+        if raw_pose.startswith('\\\\'):
+            cmd = '\\\\'
+            body = raw_pose[2:]
+        elif cmd == ';':
+            body = raw_pose[1:]
+        elif cmd == ':':
+            body = " %s" % raw_pose[1:].strip()
+        elif cmd not in [",", "'"]:
+            cmd = None
+        return {"cmd": cmd, "body": body}
+
+    @staticmethod
+    def prefix_actor_to_body(parsed=None, actor=None):
+        if not actor:
+            actor = ''
+        if parsed['cmd'] and parsed['cmd'] != '\\\\':
+            parsed['body'] = "%s%s" % (actor, parsed['body'])
+        return parsed
+
+    @staticmethod
+    def wrap_body(parsed=None, string=None):
+        if not string:
+            string = ''
+        if parsed and InlinePoseHelper.is_speech(parsed):
+            parsed['body'] = "{wrapper}{message}{wrapper}".format(wrapper=string, message=parsed['body'])
+        return parsed
+
+    @staticmethod
+    def is_speech(parsed=None):
+        if parsed and not parsed['cmd']:
+            return True
+        return False
+
+
+def old_page_text(message, actor):
+    parts = InlinePoseHelper.parse(message)
+    parts = InlinePoseHelper.prefix_actor_to_body(parts, actor)
+    return InlinePoseHelper.wrap_body(parts, "'")["body"]
+
+
+def messages(number):
+    letters = string.ascii_letters + "   .,!?'"
+    return [random.choice(PREFIXES) + "".join(random.choice(letters) for _ in range(random.randint(0, 60)))
+            for _ in range(number)]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().split("\n")[0])
+    parser.add_argument("--messages", type=int, default=100000)
+    args = parser.parse_args()
+
+    setup_django()
+    from commands.default.comms import InlinePoseParser
+
+    def new_page_text(message, actor):
+        return InlinePoseParser.parse(message, actor).wrapped("'")
+
+    inputs = messages(args.messages)
+    mismatches = [message for message in inputs if old_page_text(message, "Anna") != new_page_text(message, "Anna")]
+    print("%i messages, %i with different output" % (len(inputs), len(mismatches)))
+    for message in mismatches[:10]:
+        print("  %r" % message)
+
+    before = timed(lambda: [old_page_text(message, "Anna") for message in inputs], 5)
+    report("InlinePoseHelper", before)
+    report("InlinePoseParser", timed(lambda: [new_page_text(message, "Anna") for message in inputs], 5), before)
+
+
+if __name__ == "__main__":
+    main()
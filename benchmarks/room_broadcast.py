@@ -0,0 +1,84 @@
+"""
+Room broadcast benchmark (world/broadcast.py)
+
+Sends one message to a room of `--occupants` receivers with one to three
+sessions each, with a mix of telnet and webclient client settings, and
+compares:
+
+- per session: rendering the message once for every session, which is
+  what the Portal did for each session before;
+- broadcast: `world.broadcast.broadcast`, rendering once per profile.
+
+Sessions are stand-ins that drop their output, so only the rendering
+and grouping are measured. No database is needed.
+
+    python benchmarks/room_broadcast.py [--occupants 100]
+
+"""
+import argparse
+import os
+import random
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from _setup import report, setup_django, timed
+
+MESSAGE = "|cAnna|n smiles at |wthe crowd|n and says, \"|yHello everyone, welcome to the |rbridge|y!|n\""
+CLIENTS = (
+    ("telnet", {"TTYPE": True, "ANSI": True, "XTERM256": True}),
+    ("telnet", {"TTYPE": True, "ANSI": True}),
+    ("telnet", {}),
+    ("telnet", {"TTYPE": True, "NOCOLOR": True}),
+    ("ssl", {"TTYPE": True, "ANSI": True, "XTERM256": True, "SCREENREADER": True}),
+    ("websocket", {}),
+)
+
+
+class Session(object):
+    def __init__(self, protocol_key, protocol_flags):
+        self.protocol_key = protocol_key
+        self.protocol_flags = protocol_flags
+
+    def data_out(self, **kwargs):
+        pass
+
+
+class Receiver(object):
+    def __init__(self, sessions):
+        self.sessions = self
+        self._sessions = sessions
+
+    def all(self):
+        return self._sessions
+
+    def at_msg_receive(self, **kwargs):
+        return True
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().split("\n")[0])
+    parser.add_argument("--occupants", type=int, default=100)
+    parser.add_argument("--repeat", type=int, default=200)
+    args = parser.parse_args()
+
+    setup_django()
+    from world import broadcast
+
+    receivers = [Receiver([Session(*random.choice(CLIENTS)) for _ in range(random.randint(1, 3))])
+                 for _ in range(args.occupants)]
+    sessions = [session for receiver in receivers for session in receiver.all()]
+    profiles = set(broadcast.render_profile(session) for session in sessions)
+    print("%i occupants, %i sessions, %i render profiles" % (len(receivers), len(sessions), len(profiles)))
+
+    def per_session():
+        for session in sessions:
+            broadcast.render(MESSAGE, broadcast.render_profile(session))
+
+    before = timed(per_session, args.repeat)
+    report("render per session", before)
+    report("broadcast", timed(lambda: broadcast.broadcast([(receiver, MESSAGE) for receiver in receivers]),
+                              args.repeat), before)
+
+
+if __name__ == "__main__":
+    main()
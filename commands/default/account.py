@@ -0,0 +1,20 @@
+"""
+Account (OOC) commands. These are stored on the Account object and
+self.caller is always the Account, not the Character.
+
+"""
+from evennia.commands.default.account import CmdWho
+from world import who
+
+
+class CmdWho(CmdWho):
+    __doc__ = CmdWho.__doc__
+
+    def func(self):
+        """
+        Show the shared who list, in the view the caller may see.
+        """
+        account = self.account
+        privileged = self.cmdstring != "doing" and account is not None and \
+            (account.check_permstring("Developer") or account.check_permstring("Admins"))
+        self.msg(who.who_list(who.PRIVILEGED if privileged else who.PUBLIC))
@@ -7,77 +7,84 @@ make sure to homogenize self.caller to always be the account object
 for easy handling.
 
 """
+from collections import namedtuple
 from evennia.commands.default.comms import CmdPage
-from evennia.comms.models import Msg
-from evennia.utils import create, utils
+from evennia.utils import logger, utils
+from world import search
+from world.pages import archive, delivery, history, store, tracking
+from world.pages import search as page_search
 
 
-class InlinePoseHelper(object):
+class ParsedPose(namedtuple("ParsedPose", "cmd body is_speech")):
     """
-    The following pose commands are supported as inline message prefixes:
-       ', ;, :, \\, and ,
+    Result of parsing a message for an inline pose prefix.
+
+    cmd - the pose prefix found, or None if the message is speech
+    body - the message with the prefix handled and the actor prefixed
+    is_speech - True if the message had no pose prefix
     """
-    @staticmethod
-    def parse(raw_pose=None):
-        """
-        Parse inline supported pose syntax (', :, ;, ,, \\) such as 'page :my emote'
-        Can be used to parse straight up pose command syntax by passing the cmdstring
-        Returns a dictionary: {"cmd": "<pose_cmd>", "body": "<parsed_message_body>"}
-        """
-        # To reduce str.startswith() calls
-        cmd = raw_pose[:1]
-        body = raw_pose
-
-        # Handle command that is > one character
-        if raw_pose.startswith('\\\\'):
-            cmd = '\\\\'
-            body = raw_pose[2:]
-        elif cmd == ';':
-            body = raw_pose[1:]
-        elif cmd == ':':
-            body = " %s" % raw_pose[1:].strip()
-        # raw_pose does not have inline pose
-        elif cmd not in [",", "'"]:
-            cmd = None
-        return {"cmd": cmd, "body": body}
+    __slots__ = ()
 
-    @staticmethod
-    def prefix_actor_to_body(parsed=None, actor=None):
+    def wrapped(self, wrapper):
         """
-        Takes a dictionary provided by cls.parse and the name of the actor
-        Returns parsed dictionary unchanged or with actor prefixed to the body
-        if necessary
+        Returns the body, wrapped on each side with `wrapper` if it is speech.
         """
-        if not actor:
-            actor = ''
+        if self.is_speech:
+            return "%s%s%s" % (wrapper, self.body, wrapper)
+        return self.body
 
-        if parsed['cmd'] and parsed['cmd'] != '\\\\':
-            parsed['body'] = "%s%s" % (actor, parsed['body'])
-        return parsed
 
-    @staticmethod
-    def wrap_body(parsed=None, string=None):
-        """
-        Takes a dict provided by cls.parse and a string to wrap each side of
-        dict['body']
-        Returns the changed dictionary
-        """
-        if not string:
-            string = ''
+def _parse_speech(raw, actor):
+    return ParsedPose(None, raw, True)
 
-        if parsed and InlinePoseHelper.is_speech(parsed):
-            parsed['body'] = "{wrapper}{message}{wrapper}".format(wrapper=string, message=parsed['body'])
-        return parsed
 
-    @staticmethod
-    def is_speech(parsed=None):
+def _parse_verbatim(raw, actor):
+    # ' and , are kept in the body: "'s hat" -> "Actor's hat"
+    return ParsedPose(raw[0], actor + raw, False)
+
+
+def _parse_semicolon(raw, actor):
+    return ParsedPose(";", actor + raw[1:], False)
+
+
+def _parse_colon(raw, actor):
+    return ParsedPose(":", "%s %s" % (actor, raw[1:].strip()), False)
+
+
+def _parse_backslash(raw, actor):
+    # only a doubled backslash is a prefix; it poses without the actor
+    if raw[1:2] == "\\":
+        return ParsedPose("\\\\", raw[2:], False)
+    return ParsedPose(None, raw, True)
+
+
+class InlinePoseParser(object):
+    """
+    The following pose commands are supported as inline message prefixes:
+       ', ;, :, \\, and ,
+    """
+    # Parsers keyed on the leading character of a message
+    _dispatch = {"'": _parse_verbatim,
+                 ",": _parse_verbatim,
+                 ";": _parse_semicolon,
+                 ":": _parse_colon,
+                 "\\": _parse_backslash}
+
+    @classmethod
+    def parse(cls, raw_pose, actor=""):
         """
-        Determines if parsed['body'] is speech or not.
-        Returns True if body is speech.
+        Parse inline supported pose syntax (', :, ;, ,, \\) such as 'page :my emote'
+        in a single pass, prefixing the actor's name to the body where the
+        pose calls for it.
+
+        Args:
+            raw_pose (str): The message to parse.
+            actor (str, optional): Name of the one posing.
+
+        Returns:
+            parsed (ParsedPose): The parsed message.
         """
-        if parsed and not parsed['cmd']:
-            return True
-        return False
+        return cls._dispatch.get(raw_pose[:1], _parse_speech)(raw_pose, actor or "")
 
 
 class CmdPage(CmdPage):
@@ -87,6 +94,10 @@ class CmdPage(CmdPage):
     Usage:
       page[/switches] [[<account>,<account>,... = ]<message>]
       pages [<number>]
+      pages/older [<number>]
+      pages/unread
+      pages/archive [<YYYY-MM>]
+      pages/search <terms>[ = <page>]
 
     Aliases:
       p (page alias)
@@ -95,13 +106,18 @@ class CmdPage(CmdPage):
     Switches:
       last - shows who you last messaged (page default)
       list - show last <number> of pages sent/received (pages default)
+      older - continue listing pages older than the last ones shown
+      unread - show the pages you received while offline
+      archive - list the months of archived pages, or show a month's pages
+      search - find the pages containing all the given words, best match first
 
     Send a message to target user (if online). If no
     account(s) are given, but a message is provided, the message
     is sent to the last account(s) paged.
-    """ + InlinePoseHelper.__doc__
+    """ + InlinePoseParser.__doc__
     aliases = CmdPage.aliases + ['p', 'pages']
     arg_regex = r"\s.+|/.+|$"
+    log_slow = True
 
     def parse(self):
         super(CmdPage, self).parse()
@@ -112,6 +128,9 @@ class CmdPage(CmdPage):
             self.switches = ['last']
         elif self.cmdstring == 'pages' and not self.switches:
             self.switches = ['list']
+        elif set(self.switches) & {'older', 'unread', 'archive', 'search'}:
+            # these switches read as listing requests, not messages
+            return
 
         # Setup page last paged to support MUSH shortcut 'page <msg>'
         if self.lhs and not self.rhs:
@@ -124,73 +143,96 @@ class CmdPage(CmdPage):
         # Since account_caller is set above, this will be an Account.
         caller = self.caller
 
-        # get the messages we've sent (not to channels)
-        pages_we_sent = Msg.objects.get_messages_by_sender(caller, exclude_channel_messages=True)
-        # get last messages we've got
-        pages_we_got = Msg.objects.get_messages_by_receiver(caller)
+        if 'unread' in self.switches:
+            self.after_flush(self.list_unread)
+            return
 
-        if 'last' in self.switches:
-            if pages_we_sent:
-                recv = ",".join(obj.key for obj in pages_we_sent[-1].receivers)
-                self.msg("You last paged |c%s|n: %s" % (recv, pages_we_sent[-1].message))
+        if 'archive' in self.switches:
+            if not self.args:
+                months = archive.archived_months(caller)
+                if months:
+                    self.msg("You have archived pages from: %s\nUse |wpages/archive <YYYY-MM>|n to read them."
+                             % ", ".join(months))
+                else:
+                    self.msg("You have no archived pages.")
                 return
-            else:
-                self.msg("You haven't paged anyone yet.")
+            pages = archive.archived_pages(caller, self.args.strip())
+            if not pages:
+                self.msg("You have no archived pages from '%s'." % self.args.strip())
                 return
+            self.msg("Your archived pages from %s:\n %s" % (self.args.strip(), self.format_pages(pages)))
+            return
 
-        if 'list' in self.switches:
-            pages = pages_we_sent + pages_we_got
-            pages.sort(lambda x, y: cmp(x.date_created, y.date_created))
+        if 'search' in self.switches:
+            terms, number = self.lhs, 1
+            if self.rhs:
+                try:
+                    number = int(self.rhs)
+                except ValueError:
+                    number = 0
+            if not terms or number < 1:
+                self.msg("Usage: pages/search <terms>[ = <page>]")
+                return
+            self.after_flush(self.list_matches, terms, number)
+            return
 
-            number = 5
+        if 'list' in self.switches or 'older' in self.switches:
+            number = history.DEFAULT_PAGE_COUNT
             if self.args:
                 try:
                     number = int(self.args)
                 except ValueError:
-                    self.msg("Usage: pages [number]")
+                    number = 0
+                if number < 1:
+                    self.msg("Usage: pages[/older] [number]")
                     return
 
-            if len(pages) > number:
-                lastpages = pages[-number:]
-            else:
-                lastpages = pages
-            template = "|w%s|n |c%s|n to |c%s|n: %s"
-            lastpages = "\n ".join(template %
-                                   (utils.datetime_format(page.date_created),
-                                    ",".join(obj.key for obj in page.senders),
-                                    "|n,|c ".join([obj.name for obj in page.receivers]),
-                                    page.message) for page in lastpages)
-
-            if lastpages:
-                string = "Your latest pages:\n %s" % lastpages
-            else:
-                string = "You haven't paged anyone yet."
-            self.msg(string)
+            cursor = None
+            if 'older' in self.switches:
+                cursor = caller.ndb.pages_cursor
+                if not cursor:
+                    self.msg("There are no older pages to show.")
+                    return
+
+            self.after_flush(self.list_pages, number, cursor)
             return
 
+        if 'last' in self.switches:
+            last_receivers, last_message = tracking.last_page(caller)
+            if last_receivers is not None:
+                recv = ",".join(obj.key for obj in last_receivers)
+                self.msg("You last paged |c%s|n: %s" % (recv, last_message))
+                return
+            else:
+                self.msg("You haven't paged anyone yet.")
+                return
+
         # We are sending. Build a list of targets
         if not self.lhs:
             # If there are no targets, then set the targets
             # to the last person we paged.
-            if pages_we_sent:
-                receivers = pages_we_sent[-1].receivers
+            last_receivers, _ = tracking.last_page(caller)
+            if last_receivers:
+                receivers = last_receivers
             else:
                 self.msg("Who do you want to page?")
                 return
         else:
             receivers = self.lhslist
 
+        names = []
         recobjs = []
         for receiver in set(receivers):
             if isinstance(receiver, basestring):
-                pobj = caller.search(receiver)
+                names.append(receiver)
             elif hasattr(receiver, 'character'):
-                pobj = receiver
+                recobjs.append(receiver)
             else:
                 self.msg("Who do you want to page?")
                 return
-            if pobj:
-                recobjs.append(pobj)
+        if names:
+            recobjs.extend(result.obj for result in search.search_accounts(caller, names)
+                           if result.obj and result.obj not in recobjs)
         if not recobjs:
             self.msg("No one found to page.")
             return
@@ -199,33 +241,86 @@ class CmdPage(CmdPage):
         message = self.rhs
 
         # Handle supported inline poses
-        parts = InlinePoseHelper.parse(message)
-        parts = InlinePoseHelper.prefix_actor_to_body(parts, caller.key)
-
-        message = parts['body']
-
-        # create the persistent message object
-        create.create_message(caller, message,
-                              receivers=recobjs)
+        parsed = InlinePoseParser.parse(message, caller.key)
+        stored_message = parsed.body
 
         # Add wrapping punctuation
-        parts = InlinePoseHelper.wrap_body(parts, "'")
-        message = parts['body']
+        message = parsed.wrapped("'")
 
         # tell the accounts they got a message.
-        received = []
-        rstrings = []
-        for pobj in recobjs:
-            if not pobj.access(caller, 'msg'):
-                rstrings.append("You are not allowed to page %s." % pobj)
-                continue
-            pobj.msg("%s %s" % (header, message))
-            if hasattr(pobj, 'sessions') and not pobj.sessions.count():
-                received.append("|C%s|n" % pobj.name)
-                rstrings.append("%s is offline. They will see your message if they list their pages later."
-                                % received[-1])
-            else:
-                received.append("|c%s|n" % pobj.name)
+        online, offline, denied = delivery.deliver_page(caller, recobjs, "%s %s" % (header, message))
+
+        # create the persistent message object
+        store.persist_page(caller, stored_message, recobjs, offline=offline)
+        tracking.record_sent(caller, recobjs, stored_message)
+
+        rstrings = ["You are not allowed to page %s." % pobj for pobj in denied]
+        rstrings.extend("|C%s|n is offline. They will see your message if they list their pages later."
+                        % pobj.name for pobj in offline)
+        received = ["|c%s|n" % pobj.name for pobj in online] + ["|C%s|n" % pobj.name for pobj in offline]
         if rstrings:
             self.msg("\n".join(rstrings))
         self.msg("You paged %s with: %s" % (", ".join(received), message))
+
+    def after_flush(self, func, *args):
+        """
+        Call `func(caller, session, *args)` once the pages waiting in the
+        write-behind queue are stored, so that it reads the whole history.
+        That is right away, unless a worker thread is writing pages.
+        """
+        caller, session = self.caller, self.session
+        deferred = store.flush_pending()
+        deferred.addCallback(lambda _: func(caller, session, *args))
+        deferred.addErrback(self._read_failed, caller, session)
+
+    @staticmethod
+    def _read_failed(failure, caller, session):
+        logger.log_err("Could not read pages of %s:\n%s" % (caller, failure.getTraceback()))
+        caller.msg("|rAn error occurred while reading your pages.|n", session=session)
+
+    def list_unread(self, caller, session):
+        unread = tracking.pop_unread(caller)
+        if unread:
+            caller.msg("Pages you missed:\n %s" % self.format_pages(unread), session=session)
+        else:
+            caller.msg("You have no unread pages.", session=session)
+
+    def list_matches(self, caller, session, terms, number):
+        matches, total = page_search.search_pages(caller, terms, page=number)
+        if not matches:
+            caller.msg("No pages found matching '%s'." % terms, session=session)
+            return
+        pages = (total + page_search.RESULTS_PER_PAGE - 1) // page_search.RESULTS_PER_PAGE
+        caller.msg("Pages matching '%s' (page %i of %i, %i matches):\n %s"
+                   % (terms, number, pages, total, self.format_pages(matches)), session=session)
+
+    def list_pages(self, caller, session, number, cursor):
+        lastpages, caller.ndb.pages_cursor = history.latest_pages(caller, number, cursor=cursor)
+        lastpages = self.format_pages(lastpages)
+
+        if lastpages:
+            string = "Your %s pages:\n %s" % ("older" if cursor else "latest", lastpages)
+            if caller.ndb.pages_cursor:
+                string += "\nUse |wpages/older|n to see earlier pages."
+        else:
+            string = "You haven't paged anyone yet."
+        caller.msg(string, session=session)
+
+    def slow_command_info(self):
+        info = super(CmdPage, self).slow_command_info()
+        info.update(switches=self.switches, targets=len(self.lhslist) if self.lhs else 0)
+        return info
+
+    @staticmethod
+    def format_pages(pages):
+        """
+        Format a list of pages for display, one per line. The pages can be
+        `Msg` objects or archived pages, whose senders and receivers are
+        names.
+        """
+        template = "|w%s|n |c%s|n to |c%s|n: %s"
+        return "\n ".join(template %
+                          (utils.datetime_format(page.date_created),
+                           ",".join(getattr(obj, "key", obj) for obj in page.senders),
+                           "|n,|c ".join([getattr(obj, "name", obj) for obj in page.receivers]),
+                           page.message) for page in pages)
@@ -4,11 +4,17 @@ General Character commands usually available to all characters.
 from evennia.utils import utils, evtable
 from evennia.typeclasses.attributes import NickTemplateInvalid
 from evennia.commands.default.general import CmdNick, CmdPose, CmdWhisper
-from comms import InlinePoseHelper
+from comms import InlinePoseParser
+from world import search
+
+
+# Number of nicks shown per page of nicks/list
+NICKS_PER_PAGE = 20
 
 
 class AccountAwareCmdNick(CmdNick):
-    __doc__ = CmdNick.__doc__
+    __doc__ = CmdNick.__doc__.replace("      nicks\n", "      nicks[/list] [<page>]\n")
+    log_slow = True
 
     # Copy/pasted/modified from upstream.
     # This is done so we have complete control over the display and avoid situations where the account nicks display but
@@ -19,24 +25,30 @@ class AccountAwareCmdNick(CmdNick):
         switches = self.switches
         nicktypes = [switch for switch in switches if switch in ("object", "account", "inputline")] or ["inputline"]
 
-        nicklist = utils.make_iter(caller.nicks.get(return_obj=True) or [])
-        acct_nicklist = utils.make_iter(caller.account.nicks.get(return_obj=True) or [])
-
         if 'list' in switches or self.cmdstring in ("nicks", "@nicks"):
-
-            if not nicklist and not acct_nicklist:
+            page = self.args.strip()
+            if page and not (page.isdigit() and int(page) > 0):
+                caller.msg("Usage: nicks[/list] [<page>]")
+                return
+            page = int(page or 1)
+            acct_table, acct_pages = self.nick_table_page(caller.account.nicks, "Global", page)
+            table, pages = self.nick_table_page(caller.nicks, "Character", page)
+            pages = max(pages, acct_pages)
+
+            if not pages:
                 string = "|wNo nicks defined.|n"
+            elif page > pages:
+                string = "There %s only %i page%s of nicks." % ("is" if pages == 1 else "are",
+                                                                pages, "" if pages == 1 else "s")
             else:
-                acct_table = ''
-                table = ''
-                if acct_nicklist:
-                    acct_table = "|wDefined Global Nicks:|n\n%s" % self.build_nick_table(nicklist=acct_nicklist)
-                if nicklist:
-                    table = "|wDefined Character Nicks:|n\n%s" % self.build_nick_table(nicklist=nicklist)
                 string = "{}{}{}".format(acct_table, "\n" if acct_table and table else '', table)
+                if pages > 1:
+                    string += "\nPage %i of %i. Use |wnicks/list <page>|n to see another page." % (page, pages)
             caller.msg(string)
             return
 
+        nicklist = utils.make_iter(caller.nicks.get(return_obj=True) or [])
+
         if 'clearall' in switches:
             caller.nicks.clear()
             caller.msg("Cleared all nicks.")
@@ -101,12 +113,39 @@ class AccountAwareCmdNick(CmdNick):
         string = errstring if errstring else string
         caller.msg(string)
 
-    def build_nick_table(self, nicklist=None):
+    def nick_table_page(self, nickhandler, title, page):
+        """
+        Render one page of the nicks of a nick handler. The rendered page is
+        cached on the handler until its nicks change.
+
+        Returns:
+            table, pages (tuple): The titled table, or '' if there are no nicks
+                on that page, and the number of pages of nicks.
+        """
+        def render():
+            nicklist = utils.make_iter(nickhandler.get(return_obj=True) or [])
+            start = (page - 1) * NICKS_PER_PAGE
+            pages = (len(nicklist) + NICKS_PER_PAGE - 1) // NICKS_PER_PAGE
+            rows = nicklist[start:start + NICKS_PER_PAGE]
+            if not rows:
+                return '', pages
+            return "|wDefined %s Nicks:|n\n%s" % (title, self.build_nick_table(nicklist=rows, start=start)), pages
+
+        if hasattr(nickhandler, "rendered"):
+            return nickhandler.rendered(("list", page), render)
+        return render()
+
+    def slow_command_info(self):
+        info = super(AccountAwareCmdNick, self).slow_command_info()
+        info.update(switches=self.switches, version=getattr(self.caller.nicks, "version", None))
+        return info
+
+    def build_nick_table(self, nicklist=None, start=0):
         if nicklist:
             table = evtable.EvTable("#", "Type", "Nick match", "Replacement")
             for inum, nickobj in enumerate(nicklist):
                 _, _, nickvalue, replacement = nickobj.value
-                table.add_row(str(inum + 1), nickobj.db_category, nickvalue, replacement)
+                table.add_row(str(start + inum + 1), nickobj.db_category, nickvalue, replacement)
             return table
 
 
@@ -142,20 +181,22 @@ class CmdPose(CmdPose):
         space.
         """
         args = self.args
-        if args and not args[0] in ["'", ":"] and self.cmdstring not in [';', '\\\\']:
-            args = " %s" % args.strip()
+        if args and self.cmdstring in [';', '\\\\']:
+            # the ; and \\ aliases pose the same way as the inline prefixes
+            self.pose = InlinePoseParser.parse(self.cmdstring + args, self.caller.name).body
+        elif args:
+            if args[0] not in ["'", ":"]:
+                args = " %s" % args.strip()
+            self.pose = "%s%s" % (self.caller.name, args)
         self.args = args
 
     def func(self):
         if not self.args:
             # Super func handles error message.
-            pass
-        elif self.cmdstring == "\\\\":
-            msg = self.args
-            self.caller.location.msg_contents(text=(msg, {"type": "pose"}),
-                                              from_obj=self.caller)
+            super(CmdPose, self).func()
             return
-        super(CmdPose, self).func()
+        self.caller.location.msg_contents(text=(self.pose, {"type": "pose"}),
+                                          from_obj=self.caller)
 
 
 class CmdWhisper(CmdWhisper):
@@ -177,27 +218,53 @@ class CmdWhisper(CmdWhisper):
     If no arguments are given, then the command shows you which character(s) 
     where whispered to.
     """
+    log_slow = True
 
     def parse(self):
         super(CmdWhisper, self).parse()
         caller = self.caller
+        self.last_receivers = None
 
         # If using the whisper to last whispered format
         if self.lhs and not self.rhs:
-            last_recievers = caller.ndb.last_whisper_recievers
-            if last_recievers:
+            last_whisper = caller.ndb.last_whisper
+            if last_whisper:
                 self.rhs = self.lhs
-                self.lhs = last_recievers
+                self.lhs = last_whisper["names"]
+                self.last_receivers = self.valid_last_receivers(last_whisper)
+
+    def valid_last_receivers(self, last_whisper):
+        """
+        Returns the receivers of the last whisper if they can all still be
+        whispered to without searching for them again: every name was found
+        last time, the caller's nicks are unchanged, and the receivers still
+        exist and are still here with us. Returns None otherwise, so names
+        that failed are searched for, and reported, again.
+        """
+        location = self.caller.location
+        if not last_whisper["complete"] or last_whisper["nicks"] != self.caller.nicks.version or \
+                last_whisper["location"] != location:
+            return None
+        for receiver in last_whisper["receivers"]:
+            if not receiver.pk or receiver.location != location:
+                return None
+        return last_whisper["receivers"]
+
+    def slow_command_info(self):
+        info = super(CmdWhisper, self).slow_command_info()
+        info.update(targets=len(self.lhs.split(",")) if self.lhs else 0,
+                    reused_receivers=bool(getattr(self, "last_receivers", None)))
+        return info
 
     def func(self):
         """Run the whisper command"""
 
         caller = self.caller
-        last_recievers = caller.ndb.last_whisper_recievers
+        last_whisper = caller.ndb.last_whisper
 
         if not self.args:
-            msg = "You last whispered to {recipients}.".format(recipients="|yno one|n" if not last_recievers else
-            "|c%s|n" % last_recievers)
+            msg = "You last whispered to {recipients}.".format(recipients="|yno one|n" if not last_whisper else
+            "|c%s|n" % ", ".join(receiver.key for receiver in last_whisper["receivers"]))
             self.msg(msg)
             return
 
@@ -205,10 +272,11 @@ class CmdWhisper(CmdWhisper):
             caller.msg("Usage: whisper <character> = <message>")
             return
 
-        receivers = [recv.strip() for recv in self.lhs.split(",")]
-
-        receivers = [caller.search(receiver) for receiver in receivers]
-        receivers = [recv for recv in receivers if recv]
+        if self.last_receivers:
+            receivers = self.last_receivers
+        else:
+            results = search.search_many(caller, [recv.strip() for recv in self.lhs.split(",")])
+            receivers = [result.obj for result in results if result.obj]
 
         speech = self.rhs
         # If the speech is empty, abort the command
@@ -216,17 +284,17 @@ class CmdWhisper(CmdWhisper):
             return
 
         # Store non-persistent receivers for re-using
-        caller.ndb.last_whisper_recievers = self.lhs
+        complete = bool(self.last_receivers) or all(result.obj for result in results)
+        caller.ndb.last_whisper = {"names": self.lhs, "receivers": receivers, "location": caller.location,
+                                   "complete": complete, "nicks": caller.nicks.version}
 
-        parsed = InlinePoseHelper.parse(speech)
-        parsed = InlinePoseHelper.prefix_actor_to_body(parsed, caller.key)
+        parsed = InlinePoseParser.parse(speech, caller.key)
 
         # Call a hook to change the speech before whispering
-        if InlinePoseHelper.is_speech(parsed):
-            parsed['body'] = caller.at_before_say(parsed['body'], whisper=True, receivers=receivers)
+        if parsed.is_speech:
+            parsed = parsed._replace(body=caller.at_before_say(parsed.body, whisper=True, receivers=receivers))
 
-        parsed = InlinePoseHelper.wrap_body(parsed, "'")
-        speech = parsed['body']
+        speech = parsed.wrapped("'")
 
         # no need for self-message if we are whispering to ourselves (for some reason)
         msg_self = None if caller in receivers else '{self} whisper to {all_receivers}: {speech}'
@@ -0,0 +1,94 @@
+"""
+System commands
+
+Commands for looking at how the running game is doing. They go into the
+AccountCmdSet and are locked to developers.
+
+"""
+import json
+import os
+from django.conf import settings
+from evennia.utils import evtable
+from commands.command import MuxCommand
+from world import cmdstats, login, output
+
+# Number of commands listed by @cmdstats
+CMDSTATS_ROWS = 30
+
+
+class CmdCmdStats(MuxCommand):
+    """
+    show command performance statistics
+
+    Usage:
+      @cmdstats [<command key>]
+      @cmdstats/json [<command key>]
+      @cmdstats/dump
+      @cmdstats/reset
+      @cmdstats/output
+      @cmdstats/logins
+
+    Switches:
+      json - show the raw statistics as JSON
+      dump - write all statistics as JSON to cmdstats.json in the log dir
+      reset - throw away the statistics gathered so far
+      output - show how many frames session output coalescing saved
+      logins - show login counts and how long logins take
+
+    Lists the commands that took the most time in total since the last
+    reload, with how long a run takes (mean, 95th percentile and slowest,
+    in milliseconds), how many database queries it makes, how long they
+    take, and how many characters of text it sends. Percentiles are
+    estimated from histogram buckets. Give a command key to only show
+    commands starting with it.
+    """
+    key = "@cmdstats"
+    locks = "cmd:perm(cmdstats) or perm(Developer)"
+    help_category = "System"
+
+    def func(self):
+        caller = self.caller
+        if "reset" in self.switches:
+            cmdstats.reset()
+            caller.msg("Command statistics reset.")
+            return
+        if "output" in self.switches:
+            messages, frames = output.STATS["messages"], output.STATS["frames"]
+            caller.msg("Output coalescing: %i text messages sent in %i frames, %i frames saved (%.0f%%)."
+                       % (messages, frames, output.saved_frames(),
+                          100.0 * output.saved_frames() / messages if messages else 0))
+            return
+        if "logins" in self.switches:
+            stats = login.STATS
+            caller.msg("Logins: %i logged in, %i failed, %i accounts created, %i throttled, %i turned away "
+                       "busy, %i waiting now.\nQueue wait: %.1f ms mean, %.0f ms p95. Login time: %.1f ms "
+                       "mean, %.0f ms p95, %.0f ms max."
+                       % (stats["logins"], stats["failed"], stats["created"], stats["throttled"], stats["busy"],
+                          login.LOGIN_QUEUE.pending, stats["wait"].mean(), stats["wait"].percentile(0.95),
+                          stats["total"].mean(), stats["total"].percentile(0.95), stats["total"].maximum))
+            return
+        if "dump" in self.switches:
+            path = os.path.join(settings.LOG_DIR, "cmdstats.json")
+            cmdstats.dump(path)
+            caller.msg("Command statistics written to %s." % path)
+            return
+
+        stats = [stat for key, stat in cmdstats.STATS.items() if key.startswith(self.args.lower())]
+        if "json" in self.switches:
+            caller.msg(json.dumps(dict((stat.key, stat.as_dict()) for stat in stats), sort_keys=True),
+                       options={"raw": True})
+            return
+        if not stats:
+            caller.msg("No command statistics recorded%s." % (" for '%s'" % self.args if self.args else ""))
+            return
+
+        stats.sort(key=lambda stat: stat.time.total, reverse=True)
+        table = evtable.EvTable("Command", "Runs", "ms", "p95", "Max", "Queries", "Query ms", "Output")
+        for stat in stats[:CMDSTATS_ROWS]:
+            table.add_row(stat.key, stat.count, "%.1f" % stat.time.mean(), "%.0f" % stat.time.percentile(0.95),
+                          "%.0f" % stat.time.maximum, "%.1f" % stat.queries.mean(),
+                          "%.1f" % stat.query_time.mean(), "%.0f" % stat.output.mean())
+        string = "|wCommand statistics|n (means per run, slowest in total first):\n%s" % table
+        if len(stats) > CMDSTATS_ROWS:
+            string += "\n%i more commands not shown." % (len(stats) - CMDSTATS_ROWS)
+        caller.msg(string)
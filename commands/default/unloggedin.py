@@ -1,9 +1,21 @@
 """
 Commands that are available from the connect screen.
 """
-from evennia.commands.default.unloggedin import CmdUnconnectedHelp
-import types
-from evennia.commands.default.account import CmdWho
+import re
+from evennia.commands.default.unloggedin import (CmdUnconnectedConnect, CmdUnconnectedCreate,
+                                                 CmdUnconnectedHelp, CmdUnconnectedLook)
+from commands.default.account import CmdWho
+from world import connscreen, login
+
+
+def _credentials(args):
+    """
+    Split `<name> <password>` arguments, either of which may be quoted.
+    """
+    parts = [part.strip() for part in re.split(r"\"", args) if part.strip()]
+    if len(parts) == 1:
+        parts = parts[0].split(None, 1)
+    return parts
 
 
 class CmdUnconnectedHelp(CmdUnconnectedHelp):
@@ -36,32 +48,43 @@ You can use the |wlook|n command if you want to see the connect screen again.
 class CmdSessionWho(CmdWho):
     __doc__ = CmdWho.__doc__
 
-    class PartialMockAccount(object):
-        """
-        Partially mocked singleton, so it is kept here.
-        """
-        def __new__(cls):
-            if not hasattr(cls, 'instance'):
-                cls.instance = super(CmdSessionWho.PartialMockAccount, cls).__new__(cls)
+    def msg(self, text=None, **kwargs):
+        # there is no account to send to before logging in
+        if text:
+            self.caller.msg(text, **kwargs)
 
-            return cls.instance
 
-        def check_permstring(self, permission=None):
-            return False
+class CmdUnconnectedLook(CmdUnconnectedLook):
+    __doc__ = CmdUnconnectedLook.__doc__
+
+    def func(self):
+        """Show the connection screen, rendered once per kind of client"""
+        connscreen.connection_screen(self.caller)
 
-    @staticmethod
-    def _session_msg_wrapper(target, msg=None):
-        if msg:
-            target.caller.msg(msg)
+
+class CmdUnconnectedConnect(CmdUnconnectedConnect):
+    __doc__ = CmdUnconnectedConnect.__doc__
 
     def func(self):
-        """
-        Get all connected accounts by polling session.
-        """
+        """Check the password in the login thread pool, then log in"""
+        parts = _credentials(self.args)
+        if len(parts) == 1 and parts[0].lower() == "guest":
+            super(CmdUnconnectedConnect, self).func()
+            return
+        if len(parts) != 2:
+            self.caller.msg("\n\r Usage (without <>): connect <name> <password>")
+            return
+        login.connect(self.caller, *parts)
+
 
-        if not self.account:
-            # This is a session.
-            self.msg = types.MethodType(CmdSessionWho._session_msg_wrapper, self)
-            self.account = self.PartialMockAccount()
+class CmdUnconnectedCreate(CmdUnconnectedCreate):
+    __doc__ = CmdUnconnectedCreate.__doc__
 
-        super(CmdSessionWho, self).func()
+    def func(self):
+        """Hash the password in the login thread pool, then create the account"""
+        parts = _credentials(self.args.strip())
+        if len(parts) != 2:
+            self.caller.msg("\n Usage (without <>): create <name> <password>"
+                            "\nIf <name> or <password> contains spaces, enclose it in double quotes.")
+            return
+        login.create(self.caller, *parts)
@@ -17,8 +17,11 @@ own cmdsets by inheriting from them or directly from `evennia.CmdSet`.
 from evennia import default_cmds
 from evennia.commands.default.general import CmdNick
 from commands.default.general import AccountAwareCmdNick, CmdPose, CmdWhisper
-from commands.default.unloggedin import CmdUnconnectedHelp, CmdSessionWho
+from commands.default.account import CmdWho
+from commands.default.unloggedin import (CmdSessionWho, CmdUnconnectedConnect, CmdUnconnectedCreate,
+                                         CmdUnconnectedHelp, CmdUnconnectedLook)
 from commands.default.comms import CmdPage
+from commands.default.system import CmdCmdStats
 
 
 class CharacterCmdSet(default_cmds.CharacterCmdSet):
@@ -61,6 +64,8 @@ class AccountCmdSet(default_cmds.AccountCmdSet):
         #
         self.add(CmdNick())
         self.add(CmdPage())
+        self.add(CmdWho())
+        self.add(CmdCmdStats())
 
 
 class UnloggedinCmdSet(default_cmds.UnloggedinCmdSet):
@@ -78,7 +83,10 @@ class UnloggedinCmdSet(default_cmds.UnloggedinCmdSet):
         #
         # any commands you add below will overload the default ones.
         #
+        self.add(CmdUnconnectedConnect())
+        self.add(CmdUnconnectedCreate())
         self.add(CmdUnconnectedHelp())
+        self.add(CmdUnconnectedLook())
         self.add(CmdSessionWho())
 
 
@@ -15,6 +15,10 @@ at_server_cold_start()
 at_server_cold_stop()
 
 """
+from django.conf import settings
+from evennia import create_script, search_script
+from world import cmdsetcache, cmdstats, login
+from world.pages import history, search, store
 
 
 def at_server_start():
@@ -22,7 +26,19 @@ def at_server_start():
     This is called every time the server starts up, regardless of
     how it was shut down.
     """
-    pass
+    cmdsetcache.install()
+    cmdstats.install()
+    login.install()
+    history.ensure_indexes()
+    search.ensure_search_index()
+    store.start()
+
+    archivers = search_script("page_archiver")
+    if settings.PAGE_ARCHIVE_AGE and not archivers:
+        create_script("typeclasses.scripts.PageArchiveScript")
+    elif not settings.PAGE_ARCHIVE_AGE:
+        for archiver in archivers:
+            archiver.stop()
 
 
 def at_server_stop():
@@ -44,7 +60,7 @@ def at_server_reload_stop():
     """
     This is called only time the server stops before a reload.
     """
-    pass
+    store.stop()
 
 
 def at_server_cold_start():
@@ -60,4 +76,4 @@ def at_server_cold_stop():
     This is called only when the server goes down due to a shutdown or
     reset.
     """
-    pass
+    store.stop()
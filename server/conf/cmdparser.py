@@ -23,13 +23,110 @@ three elements being the parsed cmdname (lower case), the remaining
 arguments, and the matched cmdobject from the cmdset.
 
 
-This module is not accessed by default. To tell Evennia to use it
-instead of the default command parser, add the following line to
-your settings file:
+This game replaces the default parser with the one below, which finds
+the commands that could match the input with a prefix trie of all
+command names instead of checking every key and alias of the merged
+cmdset. The few candidates found are handed to Evennia's own parser, so
+the results (arg_regex, ignored prefixes, `name-2` multimatch indices,
+match quality) are exactly the same. Tries are built once per distinct
+merged cmdset and reused until the cmdset changes. The setting to use
+it is
 
     COMMAND_PARSER = "server.conf.cmdparser.cmdparser"
 
 """
+import re
+from django.conf import settings
+from evennia.commands import cmdparser as _default_parser
+
+_RE_MULTIMATCH = re.compile(settings.SEARCH_MULTIMATCH_REGEX, re.I + re.U)
+_CMD_IGNORE_PREFIXES = settings.CMD_IGNORE_PREFIXES
+# Tries kept; tries of cmdsets no longer in use are dropped when it fills up.
+_MAX_TRIES = 256
+_TRIES = {}
+
+
+def _strip_prefixes(string):
+    return string.lstrip(_CMD_IGNORE_PREFIXES) if _CMD_IGNORE_PREFIXES and len(string) > 1 else string
+
+
+class CommandTrie(object):
+    """
+    Prefix trie over the lower-cased names of a cmdset's commands, both as
+    they are and with ignored prefixes stripped.
+    """
+    def __init__(self, commands):
+        self.commands = commands
+        self.root = {}
+        for index, cmd in enumerate(commands):
+            for name in [cmd.key] + list(cmd.aliases):
+                if name:
+                    for form in set((name.lower(), _strip_prefixes(name).lower())):
+                        self._insert(form, index)
+
+    def _insert(self, name, index):
+        node = self.root
+        for char in name:
+            node = node.setdefault(char, {})
+        node.setdefault(None, set()).add(index)
+
+    def prefixed(self, string, found):
+        """
+        Add the indices of the commands with a name that `string` starts
+        with to the set `found`.
+        """
+        node = self.root
+        for char in string:
+            node = node.get(char)
+            if node is None:
+                return
+            if None in node:
+                found.update(node[None])
+
+
+def _get_trie(cmdset):
+    commands = list(cmdset.commands)
+    # the trie holds on to the commands, so their ids stay unique while cached
+    key = tuple(id(cmd) for cmd in commands)
+    trie = _TRIES.get(key)
+    if trie is None:
+        if len(_TRIES) >= _MAX_TRIES:
+            _TRIES.clear()
+        trie = _TRIES[key] = CommandTrie(commands)
+    return trie
+
+
+class CandidateSet(list):
+    """
+    The commands that may match an input, in cmdset order. Iterates like
+    the cmdset it was taken from.
+    """
+    @property
+    def commands(self):
+        return self
+
+
+def candidates(raw_string, cmdset):
+    """
+    Find the commands of a cmdset that the default parser could match
+    against the input, in any of the ways it tries.
+
+    Args:
+        raw_string (str): The input.
+        cmdset (CmdSet): The merged cmdset.
+
+    Returns:
+        candidates (CandidateSet): The commands, in cmdset order.
+    """
+    trie = _get_trie(cmdset)
+    found = set()
+    string = raw_string
+    while string:
+        trie.prefixed(string.lower(), found)
+        trie.prefixed(_strip_prefixes(string).lower(), found)
+        match = _RE_MULTIMATCH.match(string)
+        string = match.group("name") if match and len(match.group("name")) < len(string) else None
+    return CandidateSet(trie.commands[index] for index in sorted(found))
 
 
 def cmdparser(raw_string, cmdset, caller, match_index=None):
@@ -52,4 +149,6 @@ def cmdparser(raw_string, cmdset, caller, match_index=None):
             (possibly) separate multiple matches.
 
     """
-    # Your implementation here
+    if not raw_string:
+        return []
+    return _default_parser.cmdparser(raw_string, candidates(raw_string, cmdset), caller, match_index=match_index)
@@ -11,7 +11,9 @@ randomize which one it displays.
 
 The commands available to the user when the connection screen is shown
 are defined in commands.default_cmdsets. UnloggedinCmdSet and the
-screen is read and displayed by the unlogged-in "look" command.
+screen is read and displayed by the unlogged-in "look" command, which
+renders it once per kind of client (see world/connscreen.py); changes
+here show after a reload.
 
 """
 
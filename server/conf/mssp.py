@@ -64,7 +64,7 @@ MSSPTable = {
     "ANSI": "1",
     "GMCP": "1",
     "ATCP": "0",
-    "MCCP": "0",
+    "MCCP": "1",
     "MCP": "0",
     "MSDP": "0",
     "MSP": "0",
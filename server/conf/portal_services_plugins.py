@@ -13,6 +13,8 @@ anything. Plugin services are started last in the Portal startup
 process.
 
 """
+from evennia.server.portal.portalsessionhandler import PORTAL_SESSIONS
+from world import admission, backpressure, compression
 
 
 def start_plugin_services(portal):
@@ -21,4 +23,6 @@ def start_plugin_services(portal):
 
     portal - a reference to the main portal application.
     """
-    pass
+    admission.install(PORTAL_SESSIONS)
+    backpressure.install(PORTAL_SESSIONS)
+    compression.install(portal)
@@ -13,15 +13,16 @@ necessary except for the most custom and exotic designs - and even
 then it might be enough to just add custom session-level commands to
 the SessionCmdSet instead.
 
-This module is not normally called. To tell Evennia to use the class
-in this module instead of the default one, add the following to your
-settings file:
+This game uses the class in this module instead of the default one,
+through the following setting:
 
     SERVER_SESSION_CLASS = "server.conf.serversession.ServerSession"
 
 """
 
+from django.conf import settings
 from evennia.server.serversession import ServerSession as BaseServerSession
+from world import cmdstats, output, presence
 
 
 class ServerSession(BaseServerSession):
@@ -33,4 +34,52 @@ class ServerSession(BaseServerSession):
     to the game server. All communication between game and account goes
     through their session(s).
     """
-    pass
+    _output_buffer = None
+
+    def data_out(self, **kwargs):
+        """
+        Sending data from Evennia->Client. Output is counted towards the
+        statistics of the command running, if any. With the
+        SESSION_OUTPUT_COALESCE setting, plain text is buffered for a
+        moment and sent along with the text following it.
+        """
+        cmdstats.record_output(kwargs)
+        message = output.coalescable(kwargs) if settings.SESSION_OUTPUT_COALESCE else None
+        if message:
+            if not self._output_buffer:
+                self._output_buffer = output.OutputBuffer(super(ServerSession, self).data_out)
+            self._output_buffer.add(*message)
+        else:
+            self.flush_output()
+            super(ServerSession, self).data_out(**kwargs)
+
+    def flush_output(self):
+        """
+        Send any buffered output right away.
+        """
+        if self._output_buffer:
+            self._output_buffer.flush()
+
+    def at_login(self, account):
+        """
+        Hook called by sessionhandler when the session becomes authenticated.
+        """
+        super(ServerSession, self).at_login(account)
+        presence.login(self)
+
+    def at_disconnect(self, reason=None):
+        """
+        Hook called by sessionhandler on disconnect. Buffered output is
+        sent first.
+        """
+        self.flush_output()
+        super(ServerSession, self).at_disconnect(reason=reason)
+        presence.logout(self)
+
+    def at_sync(self):
+        """
+        Hook called when the session is resynced with the Portal, after a
+        reload.
+        """
+        super(ServerSession, self).at_sync()
+        presence.sync(self)
@@ -82,6 +82,11 @@ DATABASES = {
 
 SEARCH_MULTIMATCH_REGEX = r"(?P<name>.*)-(?P<number>[0-9]+)"
 SEARCH_MULTIMATCH_TEMPLATE = " {name}-{number}{aliases}{info}\n"
+# Trie-backed command parser, see server/conf/cmdparser.py.
+COMMAND_PARSER = "server.conf.cmdparser.cmdparser"
+# Instrumented parent of the default commands, see commands/command.py.
+COMMAND_DEFAULT_CLASS = "commands.command.MuxCommand"
+SERVER_SESSION_CLASS = "server.conf.serversession.ServerSession"
 
 ######################################################################
 # Game Time setup
@@ -128,6 +133,126 @@ DEFAULT_CHANNELS = [
 # While the MudInfo channel will also receieve this, this channel is meant for non-staffers.
 CHANNEL_CONNECTINFO = ["ConnInfo"]
 
+######################################################################
+# Command merging
+######################################################################
+
+# Reuse the merged cmdset of a caller's previous command when none of the
+# cmdsets, objects and locks that go into it changed. See
+# world/cmdsetcache.py.
+CMDSET_MERGE_CACHE = True
+# Record per-command time, database query and output statistics, shown
+# with @cmdstats. See world/cmdstats.py.
+COMMAND_STATS = True
+# Commands with slow logging on (page, nick, whisper) taking longer than
+# this many milliseconds are logged to server/logs/slow_commands.log with
+# their SQL statements and stack samples. None turns the log off.
+SLOW_COMMAND_THRESHOLD = 500
+
+######################################################################
+# Session output
+######################################################################
+
+# Combine the plain text messages sent to a session within this many
+# milliseconds (0 meaning the next reactor tick) into one message to the
+# Portal and client. See world/output.py.
+SESSION_OUTPUT_COALESCE = True
+SESSION_OUTPUT_COALESCE_WINDOW = 5
+# Most messages queued in the Portal for a client that stopped reading,
+# and what to do when there are more: "drop_oldest", "collapse" (drop
+# channel lines first and tell the client how many it missed) or
+# "disconnect". 0 turns the queues off. Queue statistics are logged to
+# the Portal log every SESSION_OUTPUT_QUEUE_LOG_INTERVAL seconds. See
+# world/backpressure.py.
+SESSION_OUTPUT_QUEUE_SIZE = 200
+SESSION_OUTPUT_QUEUE_POLICY = "collapse"
+SESSION_OUTPUT_QUEUE_LOG_INTERVAL = 300
+# Compression. New MCCP2 (telnet) streams use the zlib level of the first
+# (max CPU load, level) pair whose load the Portal is under; the last
+# level is used above all of them. Browsers get permessage-deflate unless
+# the Portal load is WEBSOCKET_DEFLATE_MAX_LOAD or more. Compression
+# statistics are logged to the Portal log every COMPRESSION_LOG_INTERVAL
+# seconds. See world/compression.py.
+COMPRESSION_LEVELS = ((0.25, 9), (0.5, 6), (0.75, 3), (1.0, 1))
+WEBSOCKET_DEFLATE = True
+WEBSOCKET_DEFLATE_MAX_LOAD = 0.9
+COMPRESSION_LOG_INTERVAL = 300
+# New connections are let through the Portal at most ADMISSION_RATE per
+# second, in bursts of up to ADMISSION_BURST, starting at
+# ADMISSION_START_RATE when the Portal starts and ramping up over
+# ADMISSION_RAMP_TIME seconds. Up to ADMISSION_QUEUE_SIZE connections
+# wait in line, those from the ADMISSION_KNOWN_MAX addresses last seen
+# (kept in ADMISSION_KNOWN_FILE) first. Set ADMISSION_RATE to 0 to let
+# all connections straight through. See world/admission.py.
+ADMISSION_RATE = 20
+ADMISSION_START_RATE = 2
+ADMISSION_RAMP_TIME = 60
+ADMISSION_BURST = 10
+ADMISSION_QUEUE_SIZE = 500
+ADMISSION_KNOWN_MAX = 5000
+ADMISSION_KNOWN_FILE = os.path.join(GAME_DIR, "server", "known_addresses.json")
+# The admission controller owns connection throttling while it is on:
+# Evennia's own connection rate limit is opened up so the two don't stack.
+if ADMISSION_RATE:
+    MAX_CONNECTION_RATE = 1000
+
+######################################################################
+# Logins
+######################################################################
+
+# Account lookups and password hashing for connect and create run in a
+# pool of LOGIN_THREADS threads, one login per address at a time. Up to
+# LOGIN_QUEUE_PER_ADDRESS more logins per address, and LOGIN_QUEUE_SIZE
+# in total, wait for their turn; more are turned away. An address with
+# LOGIN_FAILURE_LIMIT failed logins or LOGIN_CREATE_LIMIT new accounts
+# in the last LOGIN_THROTTLE_WINDOW seconds is refused. See
+# world/login.py.
+LOGIN_THREADS = 4
+LOGIN_QUEUE_SIZE = 100
+LOGIN_QUEUE_PER_ADDRESS = 3
+LOGIN_FAILURE_LIMIT = 5
+LOGIN_CREATE_LIMIT = 3
+LOGIN_THROTTLE_WINDOW = 5 * 60
+
+######################################################################
+# Who list
+######################################################################
+
+# Longest time in seconds the rendered who list is reused while nobody
+# logs in, out or (un)puppets. See world/who.py.
+WHO_CACHE_TTL = 5
+
+######################################################################
+# Room broadcasts
+######################################################################
+
+# Render room messages once per group of similar client sessions and
+# send them to the Portal pre-rendered. See world/broadcast.py.
+ROOM_BROADCAST_PRERENDER = True
+
+######################################################################
+# Page system
+######################################################################
+
+# Persist pages through a write-behind queue instead of writing each
+# page to the database before it is delivered. Queued pages are bulk
+# inserted every PAGE_WRITE_BEHIND_INTERVAL seconds, or as soon as
+# PAGE_WRITE_BEHIND_BATCH_SIZE pages are waiting.
+PAGE_WRITE_BEHIND = False
+PAGE_WRITE_BEHIND_INTERVAL = 2
+PAGE_WRITE_BEHIND_BATCH_SIZE = 100
+
+# Pages older than PAGE_ARCHIVE_AGE days are moved out of the database
+# into compressed per-account files in PAGE_ARCHIVE_DIR, where they can
+# still be read with pages/archive. The archiver moves up to
+# PAGE_ARCHIVE_BATCH_SIZE pages every PAGE_ARCHIVE_INTERVAL seconds.
+# Archived pages are deleted from the database, so this is off by
+# default: set PAGE_ARCHIVE_AGE (e.g. to 365) to turn it on.
+PAGE_ARCHIVE_AGE = None
+PAGE_ARCHIVE_DIR = os.path.join(GAME_DIR, "server", "archive", "pages")
+PAGE_ARCHIVE_INTERVAL = 60 * 10
+PAGE_ARCHIVE_BATCH_SIZE = 1000
+
 ######################################################################
 # Settings given in secret_settings.py override those in this file.
 ######################################################################
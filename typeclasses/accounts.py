@@ -23,6 +23,9 @@ several more options for customizing the Guest account system.
 """
 
 from evennia import DefaultAccount, DefaultGuest
+from evennia.utils.utils import lazy_property
+from world.nicks import CompiledNickHandler
+from world.pages import tracking
 
 
 class Account(DefaultAccount):
@@ -92,7 +95,21 @@ class Account(DefaultAccount):
      at_server_shutdown()
 
     """
-    pass
+    @lazy_property
+    def nicks(self):
+        return CompiledNickHandler(self)
+
+    def at_post_login(self, session=None, **kwargs):
+        """
+        Called after a successful login. Tells the account about pages they
+        received while offline.
+        """
+        super(Account, self).at_post_login(session=session, **kwargs)
+        count, senders = tracking.unread_count(self)
+        if count:
+            self.msg("You have %i unread page%s from %i account%s. Use |wpages/unread|n to read them."
+                     % (count, "" if count == 1 else "s", senders, "" if senders == 1 else "s"),
+                     session=session)
 
 
 class Guest(DefaultGuest):
@@ -100,4 +117,6 @@ class Guest(DefaultGuest):
     This class is used for guest logins. Unlike Accounts, Guests and their
     characters are deleted after disconnection.
     """
-    pass
+    @lazy_property
+    def nicks(self):
+        return CompiledNickHandler(self)
@@ -10,9 +10,45 @@ Note that sending data to channels are handled via the CMD_CHANNEL
 syscommand (see evennia.syscmds). The sending should normally not need
 to be modified.
 
-"""
+Sending only to online subscribers checks them against `world.presence`
+instead of each account's connection state. Connection info channels
+(CHANNEL_CONNECTINFO and CHANNEL_MUDINFO) always send only to online
+subscribers, since their messages are not kept.
 
+"""
+from django.conf import settings
 from evennia import DefaultChannel
+from evennia.accounts.models import AccountDB
+from evennia.comms.models import SubscriptionHandler
+from evennia.utils.utils import lazy_property
+from world import presence
+
+_ONLINE_ONLY_CHANNELS = set(key.lower() for key in settings.CHANNEL_CONNECTINFO or ())
+if settings.CHANNEL_MUDINFO:
+    _ONLINE_ONLY_CHANNELS.add(settings.CHANNEL_MUDINFO["key"].lower())
+
+
+class PresenceSubscriptionHandler(SubscriptionHandler):
+    """
+    Subscription handler checking who is online with `world.presence`.
+    """
+    def online(self):
+        """
+        Get the subscribers that are online. Objects are replaced by the
+        accounts puppeting them, as upstream.
+
+        Returns:
+            subscribers (list): The online accounts and other subscribers.
+        """
+        subs = []
+        for obj in self.all():
+            if not isinstance(obj, AccountDB):
+                obj = getattr(obj, "account", obj)
+                if not obj:
+                    continue
+            subs.append(obj)
+        online_ids = presence.online_account_ids(obj.id for obj in subs if isinstance(obj, AccountDB))
+        return [obj for obj in subs if not isinstance(obj, AccountDB) or obj.id in online_ids]
 
 
 class Channel(DefaultChannel):
@@ -58,4 +94,14 @@ class Channel(DefaultChannel):
         post_send_message(msg) - called just after message was sent to channel
 
     """
-    pass
+    @lazy_property
+    def subscriptions(self):
+        return PresenceSubscriptionHandler(self)
+
+    def distribute_message(self, msgobj, online=False, **kwargs):
+        """
+        Send a message to the subscribers, only to the online ones if
+        `online` is set or this is a connection info channel.
+        """
+        online = online or self.key.lower() in _ONLINE_ONLY_CHANNELS
+        super(Channel, self).distribute_message(msgobj, online=online, **kwargs)
@@ -8,6 +8,9 @@ creation commands.
 
 """
 from evennia import DefaultCharacter
+from evennia.utils.utils import lazy_property
+from world import presence
+from world.nicks import CompiledNickHandler
 
 
 class Character(DefaultCharacter):
@@ -30,4 +33,14 @@ class Character(DefaultCharacter):
     at_post_puppet - Echoes "AccountName has entered the game" to the room.
 
     """
-    pass
+    @lazy_property
+    def nicks(self):
+        return CompiledNickHandler(self)
+
+    def at_post_puppet(self, **kwargs):
+        super(Character, self).at_post_puppet(**kwargs)
+        presence.puppeted(self)
+
+    def at_post_unpuppet(self, account, session=None, **kwargs):
+        super(Character, self).at_post_unpuppet(account, session=session, **kwargs)
+        presence.unpuppeted(self, session)
@@ -5,7 +5,10 @@ Rooms are simple containers that has no location of their own.
 
 """
 
+from django.conf import settings
 from evennia import DefaultRoom
+from evennia.utils.utils import is_iter, make_iter
+from world import broadcast
 
 
 class Room(DefaultRoom):
@@ -18,4 +21,29 @@ class Room(DefaultRoom):
     See examples/object.py for a list of
     properties and methods available on all Objects.
     """
-    pass
+    def msg_contents(self, text=None, exclude=None, from_obj=None, mapping=None, **kwargs):
+        """
+        Emits a message to all objects inside this room, rendering it once
+        per group of similar client sessions instead of once per session.
+        See `world.broadcast` and `DefaultObject.msg_contents`.
+        """
+        is_outcmd = text and is_iter(text)
+        message = text[0] if is_outcmd else text
+        if kwargs or not settings.ROOM_BROADCAST_PRERENDER or not isinstance(message, basestring):
+            return super(Room, self).msg_contents(text=text, exclude=exclude, from_obj=from_obj,
+                                                  mapping=mapping, **kwargs)
+        text_kwargs = text[1] if is_outcmd and len(text) > 1 else {}
+
+        contents = self.contents
+        if exclude:
+            exclude = make_iter(exclude)
+            contents = [obj for obj in contents if obj not in exclude]
+        messages = []
+        for obj in contents:
+            if mapping:
+                substitutions = {t: sub.get_display_name(obj) if hasattr(sub, 'get_display_name') else str(sub)
+                                 for t, sub in mapping.items()}
+                messages.append((obj, message.format(**substitutions)))
+            else:
+                messages.append((obj, message))
+        broadcast.broadcast(messages, text_kwargs=text_kwargs, from_obj=from_obj)
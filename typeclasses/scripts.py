@@ -12,7 +12,9 @@ just overloads its hooks to have it perform its function.
 
 """
 
+from django.conf import settings
 from evennia import DefaultScript
+from world.pages import archive
 
 
 class Script(DefaultScript):
@@ -89,3 +91,19 @@ class Script(DefaultScript):
 
     """
     pass
+
+
+class PageArchiveScript(Script):
+    """
+    Global script that moves pages older than `settings.PAGE_ARCHIVE_AGE`
+    days out of the database into the page archive files, one batch per
+    repeat.
+    """
+    def at_script_creation(self):
+        self.key = "page_archiver"
+        self.desc = "Archives old pages"
+        self.interval = settings.PAGE_ARCHIVE_INTERVAL
+        self.persistent = True
+
+    def at_repeat(self):
+        archive.archive_old_pages()
@@ -0,0 +1,201 @@
+"""
+Connection admission
+
+When the game restarts, every client reconnects at once, and each new
+connection is handed to the Server for a session, a connection screen
+and a connection info message straight away.
+
+`install()`, called at Portal start, puts an `AdmissionController` in
+front of the Portal session handler's `connect`. It lets new
+connections through at most ADMISSION_RATE per second (with bursts of
+up to ADMISSION_BURST), starting at ADMISSION_START_RATE when the
+Portal starts and ramping up to the full rate over ADMISSION_RAMP_TIME
+seconds. Connections over the rate wait in line and are told so; those
+from addresses that connected before (kept in ADMISSION_KNOWN_FILE, so
+they survive a restart) go ahead of new ones. Past ADMISSION_QUEUE_SIZE
+waiting connections, new ones are turned away.
+
+This controller owns connection throttling. Evennia's own limit,
+MAX_CONNECTION_RATE, is set high in the game settings while it is on, so
+that the two do not stack. The Portal session handler still queues
+connections while the Server is not reachable, and calls its `connect`
+with None to work through that queue. Those calls are passed straight
+to the original `connect`.
+
+Sessions waiting in line have no session id yet, so anything they type
+is dropped; the waiting message tells them so.
+
+"""
+import json
+import os
+import time
+import weakref
+from collections import OrderedDict, deque
+from django.conf import settings
+from twisted.internet import reactor, task
+from evennia.utils import logger
+
+# Seconds between writes of the known addresses file
+SAVE_INTERVAL = 60
+
+STATS = {"admitted": 0, "queued": 0, "rejected": 0, "abandoned": 0, "max_waiting": 0}
+
+_CONTROLLER = []
+
+
+def _address(session):
+    address = getattr(session, "address", None)
+    return address[0] if isinstance(address, (tuple, list)) else address
+
+
+class AdmissionController(object):
+    """
+    Token bucket admitting new Portal sessions, with a waiting line for
+    known addresses ahead of one for new addresses.
+    """
+    def __init__(self, connect, disconnect, known=()):
+        """
+        Args:
+            connect (callable): Connects a session for real.
+            disconnect (callable): Disconnects a session for real.
+            known (iterable, optional): Addresses that connected before,
+                oldest first.
+        """
+        self.connect = connect
+        self.disconnect = disconnect
+        self.started = self.updated = time.time()
+        self.tokens = float(settings.ADMISSION_BURST)
+        self.known = OrderedDict((address, True) for address in known)
+        self.changed = False
+        self.waiting = (deque(), deque())
+        self.rejected = weakref.WeakSet()
+        self.task = None
+
+    def rate(self):
+        """
+        Get the current admission rate, in connections per second.
+        """
+        ramp = settings.ADMISSION_RAMP_TIME
+        fraction = min(1.0, (time.time() - self.started) / ramp) if ramp else 1.0
+        start = settings.ADMISSION_START_RATE
+        return start + (settings.ADMISSION_RATE - start) * fraction
+
+    def _refill(self):
+        now = time.time()
+        self.tokens = min(float(settings.ADMISSION_BURST), self.tokens + (now - self.updated) * self.rate())
+        self.updated = now
+
+    def count(self):
+        return len(self.waiting[0]) + len(self.waiting[1])
+
+    def _admit(self, session):
+        address = _address(session)
+        if address:
+            self.known.pop(address, None)
+            self.known[address] = True
+            while len(self.known) > settings.ADMISSION_KNOWN_MAX:
+                self.known.popitem(last=False)
+            self.changed = True
+        self.tokens -= 1
+        STATS["admitted"] += 1
+        self.connect(session)
+
+    def admit(self, session):
+        """
+        Replacement for the session handler's `connect`: connect a new
+        session now, or put it in line.
+        """
+        if session is None:
+            # the session handler working through its own queue
+            self.connect(session)
+            return
+        self._refill()
+        if self.tokens >= 1 and not self.count():
+            self._admit(session)
+            return
+        if self.count() >= settings.ADMISSION_QUEUE_SIZE:
+            STATS["rejected"] += 1
+            self.rejected.add(session)
+            session.disconnect("|rToo many players are connecting right now. Please try again in a minute.|n")
+            return
+        line = self.waiting[0 if _address(session) in self.known else 1]
+        line.append(session)
+        STATS["queued"] += 1
+        STATS["max_waiting"] = max(STATS["max_waiting"], self.count())
+        session.data_out(text=(("Many players are connecting right now. Please wait, you will be let in "
+                                "shortly (%i waiting). Anything you type before then is ignored."
+                                % self.count(),), {}))
+        self._schedule()
+
+    def leave(self, session):
+        """
+        Replacement for the session handler's `disconnect`: a session that
+        is still waiting just leaves the line, and one turned away was
+        never connected.
+        """
+        if session in self.rejected:
+            self.rejected.discard(session)
+            return
+        for line in self.waiting:
+            if session in line:
+                line.remove(session)
+                STATS["abandoned"] += 1
+                return
+        self.disconnect(session)
+
+    def _schedule(self):
+        if self.count() and not (self.task and self.task.active()):
+            delay = max(0.0, (1 - self.tokens) / self.rate())
+            self.task = reactor.callLater(delay, self.process)
+
+    def process(self):
+        """
+        Let waiting sessions in as the rate allows.
+        """
+        self._refill()
+        while self.tokens >= 1 and self.count():
+            self._admit((self.waiting[0] or self.waiting[1]).popleft())
+        self._schedule()
+
+    def save(self, path):
+        """
+        Write the known addresses, if they changed.
+        """
+        if not self.changed:
+            return
+        try:
+            with open(path, "w") as known_file:
+                json.dump(list(self.known), known_file)
+            self.changed = False
+        except (IOError, OSError):
+            logger.log_trace("Could not write known addresses to %s." % path)
+
+
+def _load_known(path):
+    if not os.path.exists(path):
+        return []
+    try:
+        with open(path) as known_file:
+            return json.load(known_file)
+    except (IOError, OSError, ValueError):
+        logger.log_trace("Could not read known addresses from %s." % path)
+        return []
+
+
+def install(sessionhandler):
+    """
+    Put admission control in front of new Portal sessions. Called at
+    Portal start.
+
+    Args:
+        sessionhandler (PortalSessionHandler): The Portal's session handler.
+    """
+    if not settings.ADMISSION_RATE or _CONTROLLER:
+        return
+    path = settings.ADMISSION_KNOWN_FILE
+    controller = AdmissionController(sessionhandler.connect, sessionhandler.disconnect, _load_known(path))
+    sessionhandler.connect = controller.admit
+    sessionhandler.disconnect = controller.leave
+    _CONTROLLER.append(controller)
+    task.LoopingCall(controller.save, path).start(SAVE_INTERVAL, now=False)
+    reactor.addSystemEventTrigger("before", "shutdown", controller.save, path)
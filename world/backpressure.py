@@ -0,0 +1,234 @@
+"""
+Outbound backpressure
+
+Output to a client that stops reading (a phone on a bad connection, a
+suspended laptop) piles up in the Portal: the Server sends everything to
+the Portal at once, and the Portal hands it to the connection's
+transport, which buffers whatever the client doesn't take, without
+limit.
+
+`install()`, called at Portal start, puts an `OutputQueue` in front of
+each session's transport. The queue is registered as the transport's
+producer, so Twisted tells it when the transport's write buffer is full
+and when it has drained. While the buffer is full, output to the session
+waits in the queue instead; when the queue goes over
+SESSION_OUTPUT_QUEUE_SIZE messages, the SESSION_OUTPUT_QUEUE_POLICY
+decides what gives:
+
+- "drop_oldest": the oldest queued message is dropped.
+- "collapse": the oldest queued channel message is dropped, and the
+  client is later told how many lines of each channel it missed. Other
+  messages are only dropped when the queue holds no channel messages.
+- "disconnect": the session is disconnected.
+
+Writes to other sessions never wait on a stalled one, so the memory a
+single stalled client can hold on to is bounded. Queue depths and drops
+are counted in `STATS` and logged to the Portal log every
+SESSION_OUTPUT_QUEUE_LOG_INTERVAL seconds.
+
+"""
+import re
+import weakref
+from collections import defaultdict, deque
+from django.conf import settings
+from twisted.internet import task
+from evennia.utils import logger
+
+DROP_OLDEST, COLLAPSE, DISCONNECT = "drop_oldest", "collapse", "disconnect"
+
+STATS = {"pauses": 0, "queued": 0, "dropped": 0, "collapsed": 0, "disconnected": 0, "max_depth": 0}
+
+_RE_CHANNEL_PREFIX = re.compile(r"^\[([^\]]+)\]")
+_QUEUES = weakref.WeakSet()
+_ORIGINAL = []
+_LOG_TASK = []
+
+
+def _channel(kwargs):
+    """
+    Get the name of the channel a message comes from, or None if it is not
+    a channel message.
+    """
+    text = kwargs.get("text")
+    options = {}
+    # portal-side keywords are (args, kwargs) pairs, and the options may
+    # be their own keyword or among the text's kwargs
+    for source, nested in ((kwargs.get("options"), False), (text, True)):
+        if isinstance(source, (tuple, list)) and len(source) == 2 and isinstance(source[1], dict):
+            options.update((source[1].get("options") or {}) if nested else source[1])
+    if not options.get("from_channel"):
+        return None
+    text = text[0][0] if isinstance(text, (tuple, list)) and text and text[0] else ""
+    match = _RE_CHANNEL_PREFIX.match(text) if isinstance(text, basestring) else None
+    return match.group(1) if match else "a channel"
+
+
+class OutputQueue(object):
+    """
+    Bounded queue of the output waiting for one session's client, acting
+    as a push producer for the session's transport.
+    """
+    def __init__(self, session, send):
+        """
+        Args:
+            session (PortalSession): The session.
+            send (callable): Sends output to the session for real, taking
+                the portal-side `data_out` keywords.
+        """
+        self.session = session
+        self.send = send
+        self.paused = False
+        self.closed = False
+        self.queue = deque()
+        self.dropped = 0
+        self.collapsed = defaultdict(int)
+
+    # IPushProducer, called by the transport
+
+    def pauseProducing(self):
+        self.paused = True
+        STATS["pauses"] += 1
+
+    def resumeProducing(self):
+        self.paused = False
+        self.drain()
+
+    def stopProducing(self):
+        self.closed = True
+        self.queue.clear()
+
+    def depth(self):
+        return len(self.queue)
+
+    def out(self, kwargs):
+        """
+        Send output, or queue it if the client isn't keeping up.
+        """
+        if self.closed or not (self.paused or self.queue):
+            self.send(kwargs)
+            return
+        self.queue.append(kwargs)
+        STATS["queued"] += 1
+        if len(self.queue) > settings.SESSION_OUTPUT_QUEUE_SIZE:
+            self.overflow()
+        STATS["max_depth"] = max(STATS["max_depth"], len(self.queue))
+
+    def overflow(self):
+        """
+        Apply the queue policy to a full queue.
+        """
+        policy = settings.SESSION_OUTPUT_QUEUE_POLICY
+        if policy == DISCONNECT:
+            STATS["disconnected"] += 1
+            self.stopProducing()
+            logger.log_info("Disconnecting session %s: its client is not reading its output." % self.session.sessid)
+            self.session.disconnect("Your connection was too slow to keep up with the game's output.")
+            abort = getattr(self.session.transport, "abortConnection", None)
+            if abort:
+                abort()
+            return
+        if policy == COLLAPSE:
+            for index, kwargs in enumerate(self.queue):
+                channel = _channel(kwargs)
+                if channel:
+                    del self.queue[index]
+                    self.collapsed[channel] += 1
+                    STATS["collapsed"] += 1
+                    return
+        self.queue.popleft()
+        self.dropped += 1
+        STATS["dropped"] += 1
+
+    def summary(self):
+        """
+        Tell the client what it missed, if anything.
+        """
+        missed = ["%i line%s on %s" % (count, "" if count == 1 else "s", channel)
+                  for channel, count in sorted(self.collapsed.items())]
+        if self.dropped:
+            missed.append("%i message%s" % (self.dropped, "" if self.dropped == 1 else "s"))
+        self.dropped = 0
+        self.collapsed.clear()
+        if missed:
+            self.send({"text": (("|y[Your connection fell behind; skipped %s.]|n" % ", ".join(missed),), {})})
+
+    def drain(self):
+        """
+        Send queued output until the transport is full again.
+        """
+        if not self.closed:
+            self.summary()
+        while self.queue and not self.paused and not self.closed:
+            self.send(self.queue.popleft())
+
+
+def _queue_for(session):
+    """
+    Get the output queue of a session, setting it up on first use. Returns
+    None if the session's transport can't report backpressure.
+    """
+    queue = getattr(session, "_output_queue", None)
+    if queue is None:
+        queue = False
+        transport = getattr(session, "transport", None)
+        if transport and hasattr(transport, "registerProducer"):
+            original = _ORIGINAL[0]
+            queue = OutputQueue(session, lambda kwargs: original(session, **kwargs))
+            try:
+                transport.registerProducer(queue, True)
+                _QUEUES.add(queue)
+            except Exception:
+                # the transport already has a producer
+                queue = False
+        session._output_queue = queue
+    return queue
+
+
+def data_out(session, **kwargs):
+    """
+    Replacement for the Portal session handler's `data_out`, passing the
+    output through the session's queue.
+    """
+    queue = _queue_for(session) if session else None
+    if queue:
+        queue.out(kwargs)
+    else:
+        _ORIGINAL[0](session, **kwargs)
+
+
+def depths():
+    """
+    Get the current depth of every non-empty session queue.
+
+    Returns:
+        depths (dict): {sessid: number of messages queued}
+    """
+    return dict((queue.session.sessid, queue.depth()) for queue in list(_QUEUES) if queue.depth())
+
+
+def log_stats():
+    """
+    Log the queue statistics, if there were any stalled clients.
+    """
+    if STATS["pauses"]:
+        current = depths()
+        logger.log_info("Output queues: %s; now queued: %i message(s) for %i session(s)."
+                        % (", ".join("%s %i" % item for item in sorted(STATS.items())),
+                           sum(current.values()), len(current)))
+
+
+def install(sessionhandler):
+    """
+    Put output queues in front of the Portal's sessions. Called at Portal
+    start.
+
+    Args:
+        sessionhandler (PortalSessionHandler): The Portal's session handler.
+    """
+    if settings.SESSION_OUTPUT_QUEUE_SIZE and not _ORIGINAL:
+        _ORIGINAL.append(sessionhandler.data_out)
+        sessionhandler.data_out = data_out
+        if settings.SESSION_OUTPUT_QUEUE_LOG_INTERVAL:
+            log_task = task.LoopingCall(log_stats)
+            log_task.start(settings.SESSION_OUTPUT_QUEUE_LOG_INTERVAL, now=False)
+            _LOG_TASK.append(log_task)
@@ -0,0 +1,144 @@
+"""
+Room broadcast
+
+Render-once delivery of room messages. Normally a room message is
+formatted for each receiver, then has its inlinefuncs parsed for each
+session on the Server, and its ANSI markup rendered for each session
+again in the Portal. In a crowded room with several sessions per
+account, that is the same work repeated hundreds of times.
+
+`broadcast()` instead groups the receiving sessions by everything that
+affects how text is rendered (protocol and client flags), renders each
+distinct message once per group, and sends the pre-rendered text to all
+sessions of the group as raw output the Portal passes straight through.
+
+Only telnet (incl. SSL) and webclient sessions are pre-rendered. Other
+protocols, MXP clients, and messages that contain inlinefuncs (which
+may render differently per session) are sent the normal way. So are
+messages to receivers whose typeclass overrides `msg()`, which gets the
+message as usual.
+
+Pre-rendered text relies on the Portal sending it as is: `raw` for
+telnet, and `client_raw` for the webclient, which would otherwise
+render the HTML again.
+
+"""
+import re
+from django.conf import settings
+from evennia.objects.objects import DefaultObject
+from evennia.utils import ansi, logger
+from evennia.utils.text2html import parse_html
+
+_TELNET_PROTOCOLS = ("telnet", "ssl")
+_WEBCLIENT_PROTOCOLS = ("websocket",)
+_RE_N = re.compile(r"\|n$")
+_RE_SCREENREADER_REGEX = re.compile(settings.SCREENREADER_REGEX_STRIP, re.DOTALL + re.MULTILINE)
+_DEFAULT_MSG = getattr(DefaultObject.msg, "__func__", DefaultObject.msg)
+_OWN_MSG = {}
+
+
+def _own_msg(receiver):
+    """
+    Check if a receiver's typeclass overrides `msg()`, so that messages
+    to it have to go through that.
+    """
+    cls = type(receiver)
+    if cls not in _OWN_MSG:
+        method = getattr(cls, "msg", None)
+        _OWN_MSG[cls] = method is not None and getattr(method, "__func__", method) is not _DEFAULT_MSG
+    return _OWN_MSG[cls]
+
+
+def render_profile(session):
+    """
+    Get the key of the group of sessions that render text identically.
+
+    Args:
+        session (ServerSession): The session.
+
+    Returns:
+        profile (tuple or None): The render profile, or None if text for
+            this session can't be pre-rendered.
+    """
+    flags = session.protocol_flags
+    if flags.get("RAW") or flags.get("MXP"):
+        return None
+    protocol = session.protocol_key
+    screenreader = bool(flags.get("SCREENREADER"))
+    if protocol in _TELNET_PROTOCOLS:
+        ttype = bool(flags.get("TTYPE"))
+        xterm256 = bool(flags.get("XTERM256")) if ttype else True
+        useansi = bool(flags.get("ANSI")) if ttype else True
+        nocolor = bool(flags.get("NOCOLOR")) or not (xterm256 or useansi)
+        return ("telnet", xterm256, nocolor, screenreader)
+    if protocol in _WEBCLIENT_PROTOCOLS:
+        return ("webclient", False, bool(flags.get("NOCOLOR")), screenreader)
+    return None
+
+
+def render(text, profile):
+    """
+    Render text the way the Portal would for sessions of a render profile.
+
+    Args:
+        text (str): Text with Evennia markup.
+        profile (tuple): A profile from `render_profile()`.
+
+    Returns:
+        text, options (tuple): The rendered text and the output options
+            telling the Portal to send it as-is.
+    """
+    client, xterm256, nocolor, screenreader = profile
+    if screenreader:
+        text = ansi.parse_ansi(text, strip_ansi=True, xterm256=False, mxp=False)
+        text = _RE_SCREENREADER_REGEX.sub("", text)
+    if client == "telnet":
+        # the closing |n matches what the telnet protocol adds itself
+        text = ansi.parse_ansi(_RE_N.sub("", text) + ("||n" if text.endswith("|") else "|n"),
+                               strip_ansi=nocolor, xterm256=xterm256, mxp=False)
+        return text, {"raw": True, "screenreader": False}
+    return parse_html(text, strip_ansi=nocolor), {"raw": True, "client_raw": True, "screenreader": False}
+
+
+def broadcast(messages, text_kwargs=None, from_obj=None):
+    """
+    Send one message per receiver, rendering each distinct message only
+    once per render profile.
+
+    Args:
+        messages (list): `(receiver, text)` tuples.
+        text_kwargs (dict, optional): Keywords for the `text` outputfunc,
+            like `{"type": "pose"}`.
+        from_obj (Object, optional): The sender, for the send hooks.
+    """
+    text_kwargs = text_kwargs or {}
+    rendered = {}
+    for receiver, text in messages:
+        outtext = (text, text_kwargs)
+        if _own_msg(receiver):
+            receiver.msg(text=outtext, from_obj=from_obj)
+            continue
+        try:
+            if from_obj:
+                from_obj.at_msg_send(text=outtext, to_obj=receiver)
+            if not receiver.at_msg_receive(text=outtext, options=None):
+                continue
+        except Exception:
+            logger.log_trace()
+        sessions = receiver.sessions.all()
+        if not sessions:
+            continue
+        if settings.INLINEFUNC_ENABLED and "$" in text:
+            for session in sessions:
+                session.data_out(text=outtext, options=None)
+            continue
+        for session in sessions:
+            profile = render_profile(session)
+            if profile is None:
+                session.data_out(text=outtext, options=None)
+                continue
+            key = (text, profile)
+            if key not in rendered:
+                rendered[key] = render(text, profile)
+            rendertext, options = rendered[key]
+            session.data_out(text=(rendertext, text_kwargs), options=options)
@@ -0,0 +1,192 @@
+"""
+Merged cmdset cache
+
+Every command a puppeting session runs has Evennia's cmdhandler gather
+the session, account and character cmdsets, call `at_cmdset_get` on the
+caller and on everything in the room, check the `call` lock of every
+object in the room and its inventory, fetch the channel cmdsets, and
+then merge it all (upstream only caches that last step). In a room full
+of exits and objects that is a lot of work that gives the same merged
+cmdset command after command.
+
+`install()` wraps `cmdhandler.get_and_merge_cmdsets` to skip all of it
+when nothing that goes into the merge changed since the last command.
+The cache key is built from:
+
+- the identity of every cmdset on the stacks of the session, account,
+  character and of each object in the room (so a cmdset being added or
+  removed, or an exit's cmdset being rebuilt, changes it),
+- the channel cmdsets of the account and character,
+- the ids and `call` locks of the objects around, and the permissions
+  of the caller the locks are checked against.
+
+A cache hit skips the `at_cmdset_get` hooks. Evennia's own hooks only
+(re)build default cmdsets that are missing, which changes the key
+anyway, so they are safe to skip; if the caller or anything around
+overrides the hook to change its cmdsets on the fly, the merge can't be
+cached and a normal merge is done. The same goes for objects with a
+`call` lock using lock functions that depend on anything else
+(attributes, tags, ...).
+
+The key is still built per command, by walking the room's contents, but
+that is a dictionary lookup and a few attribute reads per object where
+a merge calls a hook and checks a lock per object, then merges.
+benchmarks/cmdset_merge.py compares the two.
+
+"""
+import re
+from django.conf import settings
+from twisted.internet import defer
+from evennia.commands import cmdhandler
+from evennia.comms.channelhandler import CHANNELHANDLER
+from evennia.utils import logger
+
+# Merged cmdsets kept; the cache is emptied when it fills up.
+MAX_CACHED = 1000
+# Lock functions that only depend on the accessing object's identity and
+# permissions, which are part of the cache key.
+_STATIC_LOCKFUNCS = frozenset(("all", "true", "false", "none", "perm", "perm_above", "pperm",
+                               "pperm_above", "id", "pid", "dbref", "pdbref", "superuser"))
+_RE_LOCKFUNC = re.compile(r"(\w+)\s*\(")
+_CACHEABLE_LOCKS = {}
+_DEFAULT_HOOKS = {}
+_CACHE = {}
+_ORIGINAL = []
+
+
+class Uncacheable(Exception):
+    """
+    Raised when the merged cmdset can't be cached for a command.
+    """
+    pass
+
+
+def _static_lock(lockstring):
+    if lockstring not in _CACHEABLE_LOCKS:
+        _CACHEABLE_LOCKS[lockstring] = all(func in _STATIC_LOCKFUNCS
+                                           for func in _RE_LOCKFUNC.findall(lockstring))
+    return _CACHEABLE_LOCKS[lockstring]
+
+
+def _default_hook(entity):
+    """
+    Check if an entity's `at_cmdset_get` is one of Evennia's own.
+    """
+    cls = type(entity)
+    if cls not in _DEFAULT_HOOKS:
+        hook = getattr(cls, "at_cmdset_get", None)
+        _DEFAULT_HOOKS[cls] = hook is None or getattr(hook, "__module__", "").startswith("evennia.")
+    return _DEFAULT_HOOKS[cls]
+
+
+def _stack(entity, sources):
+    if not _default_hook(entity):
+        # the hook may change the cmdsets on every command
+        raise Uncacheable
+    stack = entity.cmdset.cmdset_stack
+    for cmdset in stack:
+        if cmdset.key == "_CMDSET_ERROR":
+            # errors are reported to the caller on every merge
+            raise Uncacheable
+    sources.extend(stack)
+    return tuple(id(cmdset) for cmdset in stack)
+
+
+def _channels(entity, sources):
+    cmdset = CHANNELHANDLER.get_cmdset(entity)
+    sources.append(cmdset)
+    return id(cmdset)
+
+
+def _caller_key(caller, account, obj):
+    key = [id(caller)]
+    for entity in (account, obj):
+        if entity:
+            key.append((entity.id, tuple(sorted(entity.permissions.all()))))
+    if account:
+        key.append((account.is_superuser, account.attributes.has("_quell")))
+    return tuple(key)
+
+
+def _local_key(obj, sources):
+    location = obj.location
+    if not location:
+        return None
+    key = []
+    for lobj in location.contents_get(exclude=obj) + obj.contents_get() + [location]:
+        lockstring = lobj.locks.get("call")
+        if not _static_lock(lockstring):
+            raise Uncacheable
+        key.append((lobj.id, lockstring, _stack(lobj, sources)))
+    return tuple(key)
+
+
+def signature(caller, session, account, obj, callertype):
+    """
+    Get everything a merge depends on for a command.
+
+    Returns:
+        key, sources (tuple): A hashable cache key and the cmdsets whose ids
+            are in it, or (None, None) if the merge can't be cached.
+    """
+    if callertype not in ("session", "account"):
+        return None, None
+    sources = []
+    try:
+        key = (callertype, _caller_key(caller, account, obj),
+               _stack(session, sources) if session else None,
+               _stack(account, sources) if account else None,
+               _channels(account, sources) if account else None,
+               _stack(obj, sources) if obj else None,
+               _channels(obj, sources) if obj else None,
+               _local_key(obj, sources) if obj else None)
+    except Uncacheable:
+        return None, None
+    return key, sources
+
+
+def get_and_merge_cmdsets(caller, session, account, obj, callertype, raw_string):
+    """
+    Drop-in replacement for `cmdhandler.get_and_merge_cmdsets` returning
+    the cached merged cmdset when nothing that goes into it changed.
+    """
+    try:
+        key, _ = signature(caller, session, account, obj, callertype)
+    except Exception:
+        logger.log_trace()
+        key = None
+    if key is not None and key in _CACHE:
+        return defer.succeed(_CACHE[key][0])
+
+    def _store(cmdset):
+        # the key is taken again as at_cmdset_get may have changed the cmdsets
+        try:
+            key, sources = signature(caller, session, account, obj, callertype)
+        except Exception:
+            logger.log_trace()
+            key = None
+        if key is not None and cmdset:
+            if len(_CACHE) >= MAX_CACHED:
+                _CACHE.clear()
+            # the sources are kept alive so their ids can't be reused
+            _CACHE[key] = (cmdset, sources)
+        return cmdset
+
+    return _ORIGINAL[0](caller, session, account, obj, callertype, raw_string).addCallback(_store)
+
+
+def clear():
+    """
+    Empty the cache.
+    """
+    _CACHE.clear()
+
+
+def install():
+    """
+    Make the cmdhandler use the cache, unless turned off with the
+    CMDSET_MERGE_CACHE setting. Called at server start.
+    """
+    if settings.CMDSET_MERGE_CACHE and not _ORIGINAL:
+        _ORIGINAL.append(cmdhandler.get_and_merge_cmdsets)
+        cmdhandler.get_and_merge_cmdsets = get_and_merge_cmdsets
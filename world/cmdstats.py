@@ -0,0 +1,406 @@
+"""
+Command statistics
+
+Per-command-key histograms of how long commands take, how many database
+queries they make (and how long those take), and how much text they send,
+for finding the slow commands on a live game. Shown with `@cmdstats`.
+
+Commands inheriting from `commands.command.Command` or `MuxCommand` (so
+all default commands, see COMMAND_DEFAULT_CLASS) `start()` a `Sample` in
+`at_pre_cmd` and `finish()` it in `at_post_cmd`, with their `parse` and
+`func` timed in between by wrappers put on each command class when it
+is created (see `timed()`). Database queries made on the main thread
+and text sent to sessions while a command runs are added to the
+innermost running command's sample.
+
+A `func` that is a generator is run by Evennia a step at a time, the
+steps spread out over later reactor iterations by their `yield`s. Its
+sample is finished when the generator is done instead, and only the
+time spent in the steps counts, not the waits between them.
+
+Commands with `log_slow` set also keep the SQL statements they issue,
+and a watchdog thread samples the main thread's Python stack while they
+run past the SLOW_COMMAND_THRESHOLD setting. Runs slower than that are
+written as one JSON record per line to `slow_commands.log` in the log
+dir (see `log_slow()`).
+
+Histograms have fixed buckets, so recording a command costs a few clock
+reads and counter increments and the memory used does not grow with the
+number of commands run. The statistics are kept in memory and start
+over on reload.
+
+"""
+import inspect
+import json
+import sys
+import threading
+import time
+import traceback
+from bisect import bisect_left
+from django.conf import settings
+from django.db.backends import utils as db_utils
+from evennia.utils import logger
+
+# Upper bounds of the histogram buckets. Values above the last bound go
+# in an overflow bucket.
+TIME_BOUNDS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000)  # milliseconds
+COUNT_BOUNDS = (0, 1, 2, 5, 10, 20, 50, 100, 200, 500)
+SIZE_BOUNDS = (0, 100, 500, 1000, 5000, 10000, 50000, 100000)  # characters
+
+# Slow command logging: log file, seconds between stack samples, and the
+# most statements, stacks and frames per stack kept for one run.
+SLOW_LOG_FILE = "slow_commands.log"
+STACK_SAMPLE_INTERVAL = 0.1
+MAX_STATEMENTS = 100
+MAX_STACKS = 10
+MAX_FRAMES = 25
+
+STATS = {}
+_ACTIVE = []
+_MAIN_THREAD = []
+# set while commands with slow logging run, to wake up the stack sampler
+_SAMPLING = threading.Event()
+
+
+class Histogram(object):
+    """
+    Fixed-bucket histogram keeping the sum and maximum of its values.
+    """
+    __slots__ = ("bounds", "counts", "total", "maximum")
+
+    def __init__(self, bounds):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)
+        self.total = 0
+        self.maximum = 0
+
+    def add(self, value):
+        self.counts[bisect_left(self.bounds, value)] += 1
+        self.total += value
+        self.maximum = max(self.maximum, value)
+
+    def mean(self):
+        number = sum(self.counts)
+        return float(self.total) / number if number else 0
+
+    def percentile(self, fraction):
+        """
+        Estimate a percentile, as the upper bound of its bucket.
+
+        Args:
+            fraction (float): The percentile, like 0.95.
+        """
+        wanted = fraction * sum(self.counts)
+        seen = 0
+        for index, count in enumerate(self.counts):
+            seen += count
+            if count and seen >= wanted:
+                return min(self.bounds[index], self.maximum) if index < len(self.bounds) else self.maximum
+        return 0
+
+    def as_dict(self):
+        return {"bounds": list(self.bounds), "counts": list(self.counts),
+                "sum": self.total, "max": self.maximum}
+
+
+class CommandStats(object):
+    """
+    The statistics of one command key.
+    """
+    def __init__(self, key):
+        self.key = key
+        self.count = 0
+        self.time = Histogram(TIME_BOUNDS)
+        self.parse_time = Histogram(TIME_BOUNDS)
+        self.func_time = Histogram(TIME_BOUNDS)
+        self.queries = Histogram(COUNT_BOUNDS)
+        self.query_time = Histogram(TIME_BOUNDS)
+        self.output = Histogram(SIZE_BOUNDS)
+
+    def add(self, sample, elapsed):
+        self.count += 1
+        self.time.add(elapsed * 1000)
+        self.parse_time.add(sample.parse_time * 1000)
+        self.func_time.add(sample.func_time * 1000)
+        self.queries.add(sample.queries)
+        self.query_time.add(sample.query_time * 1000)
+        self.output.add(sample.output)
+
+    def as_dict(self):
+        return {"count": self.count, "time": self.time.as_dict(), "parse_time": self.parse_time.as_dict(),
+                "func_time": self.func_time.as_dict(), "queries": self.queries.as_dict(),
+                "query_time": self.query_time.as_dict(), "output": self.output.as_dict()}
+
+
+class Sample(object):
+    """
+    The measurements of one run of a command.
+    """
+    __slots__ = ("key", "start", "parse_time", "func_time", "queries", "query_time", "output",
+                 "threshold", "statements", "stacks", "timing", "suspended", "paused")
+
+    def __init__(self, key, threshold=None):
+        self.key = key
+        self.start = time.time()
+        self.parse_time = self.func_time = self.query_time = 0.0
+        # set while a timed method runs; time between generator steps
+        self.timing = False
+        self.suspended = self.paused = 0.0
+        self.queries = self.output = 0
+        # only kept for runs that may be logged as slow
+        self.threshold = threshold
+        self.statements = [] if threshold is not None else None
+        self.stacks = [] if threshold is not None else None
+
+
+def start(key, log_slow=False):
+    """
+    Start measuring a run of a command.
+
+    Args:
+        key (str): The command key.
+        log_slow (bool, optional): Gather what is needed to log the run if
+            it turns out slow.
+
+    Returns:
+        sample (Sample or None): The sample to pass to `finish()`, or None
+            if statistics are turned off.
+    """
+    if not settings.COMMAND_STATS:
+        return None
+    threshold = settings.SLOW_COMMAND_THRESHOLD if log_slow else None
+    sample = Sample(key, None if threshold is None else threshold / 1000.0)
+    _ACTIVE.append(sample)
+    if sample.stacks is not None:
+        _SAMPLING.set()
+    return sample
+
+
+def finish(sample):
+    """
+    Stop measuring a run of a command and add it to the statistics.
+
+    Returns:
+        elapsed (float): How long the run took, in seconds.
+    """
+    elapsed = time.time() - sample.start - sample.paused
+    abandon(sample)
+    if sample.key not in STATS:
+        STATS[sample.key] = CommandStats(sample.key)
+    STATS[sample.key].add(sample, elapsed)
+    return elapsed
+
+
+def abandon(sample):
+    """
+    Stop measuring a run of a command without recording it, like when it
+    was aborted or raised an error.
+    """
+    if sample in _ACTIVE:
+        _ACTIVE.remove(sample)
+    if not any(active.stacks is not None for active in _ACTIVE):
+        _SAMPLING.clear()
+
+
+def suspend(sample):
+    """
+    Stop measuring a run of a command while it waits between the steps of
+    a generator `func`.
+    """
+    abandon(sample)
+    sample.suspended = time.time()
+
+
+def resume(sample):
+    """
+    Measure a suspended run of a command again.
+    """
+    sample.paused += time.time() - sample.suspended
+    _ACTIVE.append(sample)
+    if sample.stacks is not None:
+        _SAMPLING.set()
+
+
+def is_slow(sample, elapsed):
+    """
+    Check if a finished run should be logged as slow.
+    """
+    return sample.threshold is not None and elapsed >= sample.threshold
+
+
+def log_slow(sample, elapsed, info):
+    """
+    Write a slow run of a command to the slow command log.
+
+    Args:
+        sample (Sample): The finished sample.
+        elapsed (float): Seconds the run took, from `finish()`.
+        info (dict): What the command tells about the run, like its caller
+            and arguments.
+    """
+    record = {"time": sample.start, "key": sample.key, "ms": round(elapsed * 1000, 1),
+              "phases": {"parse_ms": round(sample.parse_time * 1000, 1),
+                         "func_ms": round(sample.func_time * 1000, 1),
+                         "other_ms": round((elapsed - sample.parse_time - sample.func_time) * 1000, 1)},
+              "queries": sample.queries, "query_ms": round(sample.query_time * 1000, 1),
+              "statements": sample.statements, "output": sample.output, "stacks": sample.stacks}
+    record.update(info)
+    logger.log_file(json.dumps(record, sort_keys=True), filename=SLOW_LOG_FILE)
+
+
+def _sample_stacks():
+    """
+    Loop of the stack sampler thread: while a command with slow logging
+    runs past its threshold, record what the main thread is doing.
+    """
+    main_ident = _MAIN_THREAD[0].ident
+    while True:
+        _SAMPLING.wait()
+        time.sleep(STACK_SAMPLE_INTERVAL)
+        now = time.time()
+        due = [sample for sample in list(_ACTIVE) if sample.stacks is not None and
+               now - sample.start - sample.paused >= sample.threshold and len(sample.stacks) < MAX_STACKS]
+        frame = sys._current_frames().get(main_ident) if due else None
+        if frame:
+            stack = ["%s:%s %s" % entry[:3] for entry in traceback.extract_stack(frame)[-MAX_FRAMES:]]
+            for sample in due:
+                sample.stacks.append(stack)
+
+
+def timed(attr, method):
+    """
+    Wrap a command class's `parse` or `func` to add the time it takes to
+    the `parse_time` or `func_time` of the command's running sample, the
+    one in its `_cmdstats_sample`. Only the outermost call is timed, so
+    methods calling their parent's count once. The sample is abandoned if
+    the method raises.
+
+    Args:
+        attr (str): The sample attribute to add to.
+        method (function): The method, as defined on the class.
+
+    Returns:
+        timed (function): The method to put on the class instead.
+    """
+    if inspect.isgeneratorfunction(method):
+        return _timed_steps(method)
+
+    def _timed(cmd, *args, **kwargs):
+        sample = cmd._cmdstats_sample
+        if not sample or sample.timing:
+            return method(cmd, *args, **kwargs)
+        sample.timing = True
+        begin = time.time()
+        try:
+            return method(cmd, *args, **kwargs)
+        except Exception:
+            abandon(sample)
+            raise
+        finally:
+            sample.timing = False
+            setattr(sample, attr, getattr(sample, attr) + time.time() - begin)
+    _timed.cmdstats_timed = True
+    return _timed
+
+
+def _timed_steps(method):
+    """
+    Wrap a generator `func`. The command gives up its sample to the
+    generator, which times each step and has the command record the run
+    (`_cmdstats_record`) once it is done.
+    """
+    def _timed(cmd, *args, **kwargs):
+        sample, cmd._cmdstats_sample = cmd._cmdstats_sample, None
+        generator = method(cmd, *args, **kwargs)
+        if not sample:
+            return generator
+        suspend(sample)
+        return _steps(cmd, sample, generator)
+    _timed.cmdstats_timed = True
+    return _timed
+
+
+def _steps(cmd, sample, generator):
+    value = None
+    while True:
+        resume(sample)
+        begin = time.time()
+        try:
+            step = generator.send(value)
+        except StopIteration:
+            sample.func_time += time.time() - begin
+            cmd._cmdstats_record(sample)
+            return
+        except Exception:
+            abandon(sample)
+            raise
+        sample.func_time += time.time() - begin
+        suspend(sample)
+        value = yield step
+
+
+def record_output(kwargs):
+    """
+    Count the text of an outgoing message, as given to `data_out`.
+    """
+    if _ACTIVE and "text" in kwargs:
+        text = kwargs["text"]
+        if isinstance(text, (tuple, list)):
+            text = text[0] if text else ""
+        if text:
+            _ACTIVE[-1].output += len(text)
+
+
+def _measured(execute):
+    def _execute(self, *args, **kwargs):
+        if not _ACTIVE or threading.current_thread() is not _MAIN_THREAD[0]:
+            return execute(self, *args, **kwargs)
+        sample = _ACTIVE[-1]
+        begin = time.time()
+        try:
+            return execute(self, *args, **kwargs)
+        finally:
+            duration = time.time() - begin
+            sample.queries += 1
+            sample.query_time += duration
+            if sample.statements is not None and len(sample.statements) < MAX_STATEMENTS:
+                # the statement without its parameters, which may be private text
+                sample.statements.append({"sql": args[0] if args else kwargs.get("sql"),
+                                          "ms": round(duration * 1000, 2)})
+    return _execute
+
+
+def install():
+    """
+    Start counting database queries and the stack sampler thread. Called
+    at server start, from the main thread.
+    """
+    if not _MAIN_THREAD:
+        _MAIN_THREAD.append(threading.current_thread())
+        sampler = threading.Thread(target=_sample_stacks, name="cmdstats-stack-sampler")
+        sampler.daemon = True
+        sampler.start()
+        db_utils.CursorWrapper.execute = _measured(db_utils.CursorWrapper.execute)
+        db_utils.CursorWrapper.executemany = _measured(db_utils.CursorWrapper.executemany)
+
+
+def reset():
+    """
+    Throw away all statistics.
+    """
+    STATS.clear()
+
+
+def as_dict():
+    """
+    Get all statistics, for dumping as JSON.
+    """
+    return {"time": time.time(), "commands": dict((key, stats.as_dict()) for key, stats in STATS.items())}
+
+
+def dump(path):
+    """
+    Write all statistics to a file as JSON.
+    """
+    with open(path, "w") as dumpfile:
+        json.dump(as_dict(), dumpfile, indent=1, sort_keys=True)
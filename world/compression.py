@@ -0,0 +1,201 @@
+"""
+Stream compression
+
+Telnet clients negotiate MCCP2 with Evennia's Portal (see
+evennia/server/portal/mccp.py), which compresses everything it sends them
+at zlib level 9. Webclient connections are not compressed at all.
+
+`install()`, called at Portal start, changes that:
+
+- MCCP2 streams are started at a zlib level picked from the Portal's
+  recent CPU load (COMPRESSION_LEVELS), so that a busy Portal spends less
+  time compressing. A stream keeps its level until it ends, as MCCP2 has
+  no way to change it on the fly.
+- The websocket factories accept permessage-deflate from browsers,
+  unless the Portal is busier than WEBSOCKET_DEFLATE_MAX_LOAD when the
+  client connects.
+- The bytes each telnet session sends before and after compression are
+  counted on the session (`mccp_raw` and `mccp_sent`), and the totals
+  and the sessions compressing worst are logged to the Portal log every
+  COMPRESSION_LOG_INTERVAL seconds. Webclient traffic is counted from
+  autobahn's traffic statistics where those are kept.
+
+"""
+import os
+import time
+import zlib
+from autobahn.websocket.compress import PerMessageDeflateOffer, PerMessageDeflateOfferAccept
+from django.conf import settings
+from twisted.internet import task
+from evennia.server.portal import mccp, telnet
+from evennia.server.portal.portalsessionhandler import PORTAL_SESSIONS
+from evennia.utils import logger
+
+# Seconds between CPU load samples, and how much each new sample counts
+LOAD_INTERVAL = 5
+LOAD_SMOOTHING = 0.5
+# Number of worst-compressing sessions named in the log
+LOG_WORST = 5
+
+STATS = {"telnet_raw": 0, "telnet_sent": 0, "websocket_raw": 0, "websocket_sent": 0,
+         "mccp_streams": 0, "deflate_accepted": 0, "deflate_declined": 0}
+
+_LOAD = {"load": 0.0, "cpu": None, "wall": None}
+_ORIGINAL = {}
+_TASKS = []
+
+
+def _sample_load():
+    """
+    Update the smoothed CPU load of the Portal process: the fraction of
+    wall time it spent on the CPU since the last sample.
+    """
+    times = os.times()
+    cpu, wall = times[0] + times[1], time.time()
+    if _LOAD["cpu"] is not None and wall > _LOAD["wall"]:
+        sample = min(1.0, (cpu - _LOAD["cpu"]) / (wall - _LOAD["wall"]))
+        _LOAD["load"] += LOAD_SMOOTHING * (sample - _LOAD["load"])
+    _LOAD["cpu"], _LOAD["wall"] = cpu, wall
+
+
+def load():
+    """
+    Get the Portal's recent CPU load, from 0 to 1.
+    """
+    return _LOAD["load"]
+
+
+def mccp_level():
+    """
+    Get the zlib level to start a new MCCP2 stream at.
+    """
+    current = load()
+    for max_load, level in settings.COMPRESSION_LEVELS:
+        if current < max_load:
+            return level
+    return settings.COMPRESSION_LEVELS[-1][1]
+
+
+class _LevelZlib(object):
+    """
+    Stand-in for the zlib module in `mccp` while a stream starts, making
+    the compressor `do_mccp` creates at the given level. Anything else
+    is zlib's.
+    """
+    def __init__(self, level):
+        self.level = level
+
+    def compressobj(self, *args, **kwargs):
+        return zlib.compressobj(self.level)
+
+    def __getattr__(self, name):
+        return getattr(zlib, name)
+
+
+def _do_mccp(self, option):
+    """
+    Replacement of `Mccp.do_mccp` starting the stream at an adaptive level.
+    The level is in place before the original runs, as it may send
+    queued output through the new compressor right away.
+    """
+    mccp.zlib = _LevelZlib(mccp_level())
+    try:
+        _ORIGINAL["do_mccp"](self, option)
+    finally:
+        mccp.zlib = zlib
+    STATS["mccp_streams"] += 1
+
+
+def _mccp_compress(protocol, data):
+    """
+    Replacement of `mccp_compress` counting the bytes it compresses.
+    """
+    compressed = _ORIGINAL["mccp_compress"](protocol, data)
+    if hasattr(protocol, "zlib"):
+        protocol.mccp_raw = getattr(protocol, "mccp_raw", 0) + len(data)
+        protocol.mccp_sent = getattr(protocol, "mccp_sent", 0) + len(compressed)
+        STATS["telnet_raw"] += len(data)
+        STATS["telnet_sent"] += len(compressed)
+    return compressed
+
+
+def _accept_deflate(offers):
+    """
+    Accept a browser's permessage-deflate offer, unless the Portal is busy.
+    """
+    for offer in offers:
+        if isinstance(offer, PerMessageDeflateOffer):
+            if load() >= settings.WEBSOCKET_DEFLATE_MAX_LOAD:
+                STATS["deflate_declined"] += 1
+                return None
+            STATS["deflate_accepted"] += 1
+            return PerMessageDeflateOfferAccept(offer)
+    return None
+
+
+def _websocket_factories(portal):
+    for service in portal.services:
+        factory = getattr(service, "factory", None) or \
+            next((arg for arg in getattr(service, "args", ()) if hasattr(arg, "setProtocolOptions")), None)
+        if hasattr(factory, "setProtocolOptions"):
+            yield factory
+
+
+def ratio(raw, sent):
+    return float(raw) / sent if sent else 0.0
+
+
+def log_stats():
+    """
+    Log the compression totals and the telnet sessions compressing worst.
+    """
+    sessions = list(PORTAL_SESSIONS.values())
+    for session in sessions:
+        traffic = getattr(session, "trafficStats", None)
+        if traffic:
+            raw = getattr(traffic, "outgoingOctetsAppLevel", 0) or 0
+            sent = getattr(traffic, "outgoingOctetsWireLevel", 0) or 0
+            STATS["websocket_raw"] += raw - getattr(session, "deflate_raw", 0)
+            STATS["websocket_sent"] += sent - getattr(session, "deflate_sent", 0)
+            session.deflate_raw, session.deflate_sent = raw, sent
+    if not STATS["telnet_raw"] and not STATS["websocket_raw"]:
+        return
+    worst = sorted((ratio(session.mccp_raw, session.mccp_sent), session.sessid)
+                   for session in sessions if getattr(session, "mccp_sent", 0))[:LOG_WORST]
+    logger.log_info("Compression: load %.2f (MCCP level %i); telnet %i -> %i bytes (%.1fx); "
+                    "webclient %i -> %i bytes (%.1fx); %i MCCP streams, deflate %i accepted, %i declined%s"
+                    % (load(), mccp_level(), STATS["telnet_raw"], STATS["telnet_sent"],
+                       ratio(STATS["telnet_raw"], STATS["telnet_sent"]), STATS["websocket_raw"],
+                       STATS["websocket_sent"], ratio(STATS["websocket_raw"], STATS["websocket_sent"]),
+                       STATS["mccp_streams"], STATS["deflate_accepted"], STATS["deflate_declined"],
+                       "; worst sessions: %s" % ", ".join("#%s %.1fx" % (sessid, rate) for rate, sessid in worst)
+                       if worst else ""))
+
+
+def install(portal):
+    """
+    Set up adaptive compression. Called at Portal start.
+
+    Args:
+        portal (Portal): The Portal, whose services hold the websocket
+            factories.
+    """
+    if _ORIGINAL:
+        return
+    _ORIGINAL["do_mccp"] = mccp.Mccp.do_mccp
+    _ORIGINAL["mccp_compress"] = telnet.mccp_compress
+    mccp.Mccp.do_mccp = _do_mccp
+    telnet.mccp_compress = _mccp_compress
+
+    if settings.WEBSOCKET_DEFLATE:
+        for factory in _websocket_factories(portal):
+            factory.setProtocolOptions(perMessageCompressionAccept=_accept_deflate)
+
+    _sample_load()
+    load_task = task.LoopingCall(_sample_load)
+    load_task.start(LOAD_INTERVAL, now=False)
+    _TASKS.append(load_task)
+    if settings.COMPRESSION_LOG_INTERVAL:
+        log_task = task.LoopingCall(log_stats)
+        log_task.start(settings.COMPRESSION_LOG_INTERVAL, now=False)
+        _TASKS.append(log_task)
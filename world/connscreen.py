@@ -0,0 +1,79 @@
+"""
+Connection screen cache
+
+The connection screen is sent to every new connection and on every
+`look` before logging in, which bots scanning for open ports and
+clients reconnecting in a storm do hundreds of times a minute. Each
+time, Evennia picks the screen from CONNECTION_SCREEN_MODULE again and
+the Portal parses its markup again for the client.
+
+`connection_screen()` renders each screen once per render profile (see
+`world.broadcast.render_profile`: protocol, colour support and screen
+reader mode) and sends the cached text as raw output. Raw output skips
+the inlinefunc pass the Server makes on outgoing text, so the screens'
+inlinefuncs are parsed once, when the screens are loaded. The cache lives
+in memory, so it is rebuilt after every reload, which is also when
+changes to the screens module take effect.
+
+A CONNECTION_SCREEN_MODULE with a `connection_screen()` callable
+computes its screen on each call, so that screen is rendered every time.
+
+"""
+import random
+from django.conf import settings
+from evennia.utils import utils
+from evennia.utils.inlinefuncs import parse_inlinefunc
+from world import broadcast
+
+STATS = {"hits": 0, "misses": 0}
+
+_SCREENS = []
+_RENDERED = {}
+
+
+def screens():
+    """
+    Get the connection screens to pick from.
+
+    Returns:
+        screens (list or None): The screen strings, or None if the module
+            computes its screen with a `connection_screen()` callable.
+    """
+    if not _SCREENS:
+        callables = utils.callables_from_module(settings.CONNECTION_SCREEN_MODULE)
+        if "connection_screen" in callables:
+            return None
+        loaded = utils.make_iter(utils.string_from_module(settings.CONNECTION_SCREEN_MODULE) or
+                                 "No connection screen found. Please contact an admin.")
+        if settings.INLINEFUNC_ENABLED:
+            loaded = [parse_inlinefunc(screen) for screen in loaded]
+        _SCREENS.extend(loaded)
+    return _SCREENS
+
+
+def connection_screen(session):
+    """
+    Send a connection screen to a session.
+
+    Args:
+        session (ServerSession): The session, not logged in yet.
+    """
+    choices = screens()
+    if choices is None:
+        text = utils.callables_from_module(settings.CONNECTION_SCREEN_MODULE)["connection_screen"]()
+        session.msg(text)
+        return
+    index = random.randrange(len(choices))
+    profile = broadcast.render_profile(session)
+    if profile is None:
+        session.msg(choices[index])
+        return
+    key = (index, profile)
+    rendered = _RENDERED.get(key)
+    if rendered is None:
+        STATS["misses"] += 1
+        rendered = _RENDERED[key] = broadcast.render(choices[index], profile)
+    else:
+        STATS["hits"] += 1
+    text, options = rendered
+    session.data_out(text=(text, {}), options=options)
@@ -0,0 +1,323 @@
+"""
+Login pipeline
+
+Evennia's `connect` and `create` commands look the account up and hash
+the password on the reactor thread. Password hashing is slow on
+purpose, so a burst of logins (everyone reconnecting after a restart)
+stalls the game for everyone already playing.
+
+`connect()` and `create()` run the account lookup and the password
+hashing in a small thread pool of LOGIN_THREADS threads, and finish the
+login on the reactor when they're done:
+
+- Each address gets one login worked on at a time. At most
+  LOGIN_QUEUE_PER_ADDRESS more wait behind it, and at most
+  LOGIN_QUEUE_SIZE logins wait in total. Logins over either limit are
+  turned away with a message to try again.
+- An address making LOGIN_FAILURE_LIMIT failed logins, or
+  LOGIN_CREATE_LIMIT account creations, within LOGIN_THROTTLE_WINDOW
+  seconds is refused until the oldest of them is that old.
+- Accounts are created on the reactor without a password (so nothing is
+  hashed there), and get the hash computed in the pool.
+- Failed logins call the account's `at_failed_login` hook, and failed
+  logins, logins and account creations are written to the security log,
+  as Evennia's commands do.
+
+How long logins wait for the pool and take in all is kept in `STATS`,
+shown by `@cmdstats/logins`.
+
+"""
+import re
+import time
+from collections import defaultdict, deque
+from django.conf import settings
+from django.contrib.auth import hashers
+from django.db import close_old_connections
+from twisted.internet import defer, reactor, threads
+from twisted.python.threadpool import ThreadPool
+from evennia.accounts.models import AccountDB
+from evennia.commands.default.unloggedin import _create_account, _create_character
+from evennia.objects.models import ObjectDB
+from evennia.server.models import ServerConfig
+from evennia.utils import logger
+from world.cmdstats import TIME_BOUNDS, Histogram
+
+FAILED, CREATED = "failed", "created"
+
+STATS = {"logins": 0, "failed": 0, "created": 0, "throttled": 0, "busy": 0,
+         "wait": Histogram(TIME_BOUNDS), "total": Histogram(TIME_BOUNDS)}
+
+_RE_VALID = re.compile(r"^[\w. @+\-']+$")
+_ATTEMPTS = {FAILED: defaultdict(deque), CREATED: defaultdict(deque)}
+_POOL = []
+
+
+class LoginQueue(object):
+    """
+    Thread pool running login work, one login per address at a time.
+    """
+    def __init__(self):
+        self.pending = 0
+        self.addresses = {}
+
+    def run(self, address, func, *args):
+        """
+        Queue login work.
+
+        Args:
+            address (str): The address logging in.
+            func (callable): The work, run in the login thread pool.
+
+        Returns:
+            deferred (Deferred or None): Fires with the result of `func`, or
+                None if the queue is full.
+        """
+        semaphore = self.addresses.get(address)
+        if self.pending >= settings.LOGIN_QUEUE_SIZE or \
+                (semaphore and len(semaphore.waiting) >= settings.LOGIN_QUEUE_PER_ADDRESS):
+            return None
+        if semaphore is None:
+            semaphore = self.addresses[address] = defer.DeferredSemaphore(1)
+        self.pending += 1
+        deferred = semaphore.run(self._run, time.time(), func, *args)
+        deferred.addBoth(self._done, address, semaphore)
+        return deferred
+
+    def _run(self, queued, func, *args):
+        STATS["wait"].add((time.time() - queued) * 1000)
+        return threads.deferToThreadPool(reactor, _POOL[0], func, *args)
+
+    def _done(self, result, address, semaphore):
+        self.pending -= 1
+        if semaphore.tokens == semaphore.limit and not semaphore.waiting:
+            self.addresses.pop(address, None)
+        return result
+
+
+LOGIN_QUEUE = LoginQueue()
+
+
+def _address(session):
+    address = session.address
+    return address[0] if isinstance(address, (tuple, list)) else address
+
+
+def throttled(address, kind):
+    """
+    Check if an address made too many attempts of a kind recently.
+
+    Args:
+        address (str): The address.
+        kind (str): FAILED or CREATED.
+    """
+    attempts = _ATTEMPTS[kind]
+    if address not in attempts:
+        return False
+    times = attempts[address]
+    while times and times[0] <= time.time() - settings.LOGIN_THROTTLE_WINDOW:
+        times.popleft()
+    if not times:
+        del attempts[address]
+        return False
+    return len(times) >= (settings.LOGIN_FAILURE_LIMIT if kind == FAILED else settings.LOGIN_CREATE_LIMIT)
+
+
+def _attempted(address, kind):
+    _ATTEMPTS[kind][address].append(time.time())
+
+
+def _still_waiting(session):
+    """
+    Check that a session is still connected and not logged in, once its
+    login work is done.
+    """
+    return session.sessionhandler.get(session.sessid) is session and not session.logged_in
+
+
+def _banned(session, name):
+    """
+    Check name and address bans, disconnecting the session if banned.
+    """
+    bans = ServerConfig.objects.conf("server_bans")
+    address = _address(session)
+    if bans and (any(ban[0] == name.lower() for ban in bans) or
+                 any(ban[2].match(address) for ban in bans if ban[2])):
+        session.msg("|rYou have been banned and cannot continue from here."
+                    "\nIf you feel this ban is in error, please email an admin.|x")
+        session.sessionhandler.disconnect(session, "Good bye! Disconnecting.")
+        return True
+    return False
+
+
+def _queue(session, func, *args):
+    """
+    Queue login work for a session, telling it if the queue is full.
+    """
+    deferred = LOGIN_QUEUE.run(_address(session), func, *args)
+    if deferred is None:
+        STATS["busy"] += 1
+        session.msg("|RThe server is busy logging in other players. Please try again in a moment.|n")
+    return deferred
+
+
+def _error(failure, session):
+    logger.log_trace("Login failed: %s" % failure.getErrorMessage())
+    if _still_waiting(session):
+        session.msg("|RAn error occurred while logging in. Please try again.|n")
+
+
+def _check_password(name, password):
+    """
+    Look up an account and check its password. Runs in the login pool.
+
+    Returns:
+        account, valid, rehashed (tuple): The account (None if there is no
+            such account), if the password matched, and a new hash for it if
+            the hashing settings changed since it was set.
+    """
+    close_old_connections()
+    account = AccountDB.objects.get_account_from_name(name)
+    if not account:
+        # hash anyway, so a missing account takes as long as a wrong password
+        hashers.make_password(password)
+        return None, False, None
+    rehashed = []
+    valid = hashers.check_password(password, account.password,
+                                   setter=lambda raw: rehashed.append(hashers.make_password(raw)))
+    return account, valid, rehashed[0] if rehashed else None
+
+
+def _hash_new_password(name, password):
+    """
+    Check that an account name is free and hash the new account's
+    password. Runs in the login pool.
+
+    Returns:
+        taken, encoded (tuple): If the name is taken, and the password hash.
+    """
+    close_old_connections()
+    if AccountDB.objects.filter(username__iexact=name).exists():
+        return True, None
+    return False, hashers.make_password(password)
+
+
+def connect(session, name, password):
+    """
+    Log a session in to an existing account.
+
+    Args:
+        session (ServerSession): The session, not logged in.
+        name (str): The account name.
+        password (str): The password.
+    """
+    if throttled(_address(session), FAILED):
+        STATS["throttled"] += 1
+        session.msg("|RYou made too many connection attempts. Try again in a few minutes.|n")
+        return
+    deferred = _queue(session, _check_password, name, password)
+    if deferred:
+        deferred.addCallback(_password_checked, session, name, time.time())
+        deferred.addErrback(_error, session)
+
+
+def _password_checked(result, session, name, started):
+    account, valid, rehashed = result
+    STATS["total"].add((time.time() - started) * 1000)
+    if not _still_waiting(session):
+        return
+    address = _address(session)
+    if not valid:
+        STATS["failed"] += 1
+        _attempted(address, FAILED)
+        logger.log_sec("Authentication Failure: %s (Client IP: %s)." % (account or name, address))
+        if account:
+            account.at_failed_login(session)
+        session.msg("Incorrect login information given.")
+        return
+    if rehashed:
+        account.password = rehashed
+        account.save(update_fields=["password"])
+    if _banned(session, account.name):
+        logger.log_sec("Authentication Denied (Banned): %s (Client IP: %s)." % (account, address))
+        return
+    STATS["logins"] += 1
+    logger.log_sec("Authentication Success: %s (Client IP: %s)." % (account, address))
+    session.sessionhandler.login(session, account)
+
+
+def create(session, name, password):
+    """
+    Create a new account, and a character for it if MULTISESSION_MODE is
+    below 2.
+
+    Args:
+        session (ServerSession): The session, not logged in.
+        name (str): The account name.
+        password (str): The password.
+    """
+    if throttled(_address(session), CREATED):
+        STATS["throttled"] += 1
+        session.msg("|RYou are creating too many accounts. Try again in a few minutes.|n")
+        return
+    if not _RE_VALID.match(name) or not (0 < len(name) <= 30):
+        session.msg("\n\r Accountname can max be 30 characters or fewer. "
+                    "Letters, spaces, digits and @/./+/-/_/' only.")
+        return
+    name = re.sub(r"\s+", " ", name).strip()
+    if settings.GUEST_LIST and name.lower() in (guest.lower() for guest in settings.GUEST_LIST):
+        session.msg("\n\r That name is reserved. Please choose another Accountname.")
+        return
+    if not _RE_VALID.match(password) or len(password) <= 3:
+        session.msg("\n\r Password should be longer than 3 characters. Letters, spaces, digits and "
+                    "@/./+/-/_/' only.\nFor best security, make it longer than 8 characters. You can "
+                    "also use a phrase of\nmany words if you enclose the password in double quotes.")
+        return
+    if _banned(session, name):
+        return
+    deferred = _queue(session, _hash_new_password, name, password)
+    if deferred:
+        deferred.addCallback(_password_hashed, session, name, time.time())
+        deferred.addErrback(_error, session)
+
+
+def _password_hashed(result, session, name, started):
+    taken, encoded = result
+    STATS["total"].add((time.time() - started) * 1000)
+    if not _still_waiting(session):
+        return
+    # checked again here, as the name may have been taken while hashing
+    if taken or AccountDB.objects.filter(username__iexact=name).exists():
+        session.msg("Sorry, there is already an account with the name '%s'." % name)
+        return
+    _attempted(_address(session), CREATED)
+    permissions = settings.PERMISSION_ACCOUNT_DEFAULT
+    # created without a password: set_password(None) stores an unusable
+    # one without hashing anything
+    account = _create_account(session, name, None, permissions)
+    if not account:
+        return
+    # the hash computed in the login pool, set as is, not hashed again
+    account.password = encoded
+    account.save(update_fields=["password"])
+    logger.log_sec("Account Created: %s (IP: %s)." % (account, _address(session)))
+    if settings.MULTISESSION_MODE < 2:
+        home = ObjectDB.objects.get_id(settings.DEFAULT_HOME)
+        _create_character(session, account, settings.BASE_CHARACTER_TYPECLASS, home, permissions)
+    STATS["created"] += 1
+    string = "A new account '%s' was created. Welcome!"
+    if " " in name:
+        string += "\n\nYou can now log in with the command 'connect \"%s\" <your password>'."
+    else:
+        string += "\n\nYou can now log with the command 'connect %s <your password>'."
+    session.msg(string % (name, name))
+
+
+def install():
+    """
+    Start the login thread pool. Called at server start.
+    """
+    if not _POOL:
+        pool = ThreadPool(minthreads=0, maxthreads=settings.LOGIN_THREADS, name="login")
+        pool.start()
+        reactor.addSystemEventTrigger("during", "shutdown", pool.stop)
+        _POOL.append(pool)
@@ -0,0 +1,179 @@
+"""
+Nicks
+
+A nick handler that compiles its nicks into a matcher instead of trying
+every nick regex against every line of input.
+
+Evennia's `NickHandler.nickreplace` gathers the caller's nicks (and
+their account's), then runs each nick's regex against the input until
+one matches, so every line typed costs one regex match per nick.
+`CompiledNickHandler` builds a `NickMatcher` from the merged character
+and account nicks instead. Nicks are bucketed on their first word, so
+only the nicks starting with the input's first word, plus the few nicks
+starting with a wildcard or `$`-marker, are tried. The matcher is kept
+until a nick is added or removed on the handler (or the account's
+handler).
+
+The handler also caches text rendered from its nicks, like the `nicks`
+listing, until the nicks change.
+
+The handler is used for the `nicks` of `typeclasses.accounts.Account`,
+`typeclasses.accounts.Guest` and `typeclasses.characters.Character`.
+
+"""
+import re
+from collections import defaultdict
+from itertools import chain
+from evennia.typeclasses.attributes import NickHandler
+from evennia.utils.utils import make_iter
+
+_RE_WILDCARD = re.compile(r"[$*?\[]")
+_REGEX_FLAGS = re.I + re.DOTALL + re.U
+
+
+def _first_word(string):
+    words = string.split(None, 1)
+    return words[0].lower() if words else ""
+
+
+class NickMatcher(object):
+    """
+    Nicks compiled for matching against input: precompiled regexes bucketed
+    on the nick's literal first word.
+    """
+    def __init__(self, nicks):
+        """
+        Args:
+            nicks (list): Nick Attributes, in order of priority.
+        """
+        self.buckets = defaultdict(list)
+        self.wildcards = []
+        self.empty = not nicks
+        for nick in nicks:
+            nick_regex, template, nickstring, _ = nick.value
+            entry = (re.compile(nick_regex, _REGEX_FLAGS), template)
+            word = _first_word(nickstring)
+            if not word or _RE_WILDCARD.search(word):
+                self.wildcards.append(entry)
+            else:
+                self.buckets[word].append(entry)
+
+    def replace(self, raw_string):
+        """
+        Replace the input with the first matching nick's replacement.
+
+        Returns:
+            string (str): The replaced string. As with `nickreplace`, the
+                input is returned stripped if there are any nicks at all.
+        """
+        if self.empty:
+            return raw_string
+        string = raw_string.strip()
+        for regex, template in chain(self.buckets.get(_first_word(string), ()), self.wildcards):
+            match = regex.match(string)
+            if match:
+                return template.format(**match.groupdict())
+        return string
+
+
+class CompiledNickHandler(NickHandler):
+    """
+    Nick handler keeping a version counter that changes whenever its nicks
+    change, and replacing input through a cached `NickMatcher`.
+    """
+    def __init__(self, *args, **kwargs):
+        super(CompiledNickHandler, self).__init__(*args, **kwargs)
+        self.version = 0
+        self._matchers = {}
+        self._rendered = {}
+        self._rendered_version = 0
+
+    def add(self, *args, **kwargs):
+        self.version += 1
+        return super(CompiledNickHandler, self).add(*args, **kwargs)
+
+    def batch_add(self, *args, **kwargs):
+        self.version += 1
+        return super(CompiledNickHandler, self).batch_add(*args, **kwargs)
+
+    def remove(self, *args, **kwargs):
+        self.version += 1
+        return super(CompiledNickHandler, self).remove(*args, **kwargs)
+
+    def clear(self, *args, **kwargs):
+        self.version += 1
+        return super(CompiledNickHandler, self).clear(*args, **kwargs)
+
+    def rendered(self, key, render):
+        """
+        Get text rendered from our nicks, rendering it only if our nicks
+        changed since it was last rendered.
+
+        Args:
+            key (hashable): What is rendered, like `("list", 2)`.
+            render (callable): Called without arguments to render it.
+
+        Returns:
+            rendered (any): What `render` returned.
+        """
+        if self._rendered_version != self.version:
+            self._rendered = {}
+            self._rendered_version = self.version
+        if key not in self._rendered:
+            self._rendered[key] = render()
+        return self._rendered[key]
+
+    def _account_handler(self, include_account):
+        obj = self.obj
+        if include_account and getattr(obj, "has_account", False):
+            return obj.account.nicks
+        return None
+
+    def _build_matcher(self, categories, account_handler):
+        # later nicks with the same key override earlier ones, and the
+        # account's nicks override the character's, as in nickreplace.
+        nicks = {}
+        for handler in (self, account_handler):
+            if handler:
+                for category in categories:
+                    nicks.update((nick.key, nick) for nick in
+                                 make_iter(handler.get(category=category, return_obj=True))
+                                 if nick and nick.key)
+        return NickMatcher(list(nicks.values()))
+
+    def get_matcher(self, categories=("inputline", "channel"), include_account=True):
+        """
+        Get the compiled matcher for the given nick categories, rebuilding it
+        only if our nicks, or those of our account, changed since last time.
+
+        Returns:
+            matcher (NickMatcher): The matcher.
+        """
+        categories = tuple(make_iter(categories))
+        account_handler = self._account_handler(include_account)
+        # a handler without a version can't tell us when it changed
+        account_version = getattr(account_handler, "version", object()) if account_handler else None
+        version = (self.version, id(account_handler), account_version)
+        cached = self._matchers.get(categories)
+        if not cached or cached[0] != version:
+            cached = self._matchers[categories] = (version, self._build_matcher(categories, account_handler))
+        return cached[1]
+
+    def nickreplace(self, raw_string, categories=("inputline", "channel"), include_account=True):
+        """
+        Apply nick replacement of entries in raw_string with nick replacement.
+
+        Args:
+            raw_string (str): The string in which to perform nick
+                replacement.
+            categories (tuple, optional): Replacement categories in
+                which to perform the replacement, such as "inputline",
+                "channel" etc.
+            include_account (bool, optional): Also include replacement
+                with nicks stored on the Account level.
+
+        Returns:
+            string (str): A string with matching keys replaced with
+                their nick equivalents.
+        """
+        return self.get_matcher(categories, include_account).replace(raw_string)
@@ -0,0 +1,115 @@
+"""
+Session output coalescing
+
+In a busy scene a session gets many small messages per second (poses,
+channel lines, connection notices), and each is sent to the Portal over
+AMP on its own and written to the client as its own TCP frame.
+`OutputBuffer` instead collects the plain text messages sent to a
+session within a short window (SESSION_OUTPUT_COALESCE_WINDOW
+milliseconds, 0 for the next reactor tick) and sends them as one
+message, one line each.
+
+Only messages that are nothing but text are buffered, and only together
+with messages having the same text keywords and output options, so each
+combined message renders exactly like its parts. Anything else, like
+OOB data or the prompt, first flushes the buffer, which keeps the order
+of all output.
+
+`STATS` counts the messages buffered and the frames they were sent in,
+shown with `@cmdstats/output`.
+
+"""
+from django.conf import settings
+from twisted.internet import reactor
+
+# Most messages combined into one; a full buffer is flushed at once.
+MAX_BUFFERED = 100
+
+STATS = {"messages": 0, "frames": 0}
+
+
+def coalescable(kwargs):
+    """
+    Check if output given to `data_out` can be buffered.
+
+    Returns:
+        text, text_kwargs, options (tuple or None): The parts of the
+            message, or None if it has to be sent as it is.
+    """
+    options = kwargs.get("options")
+    if len(kwargs) != (2 if "options" in kwargs else 1) or "text" not in kwargs:
+        return None
+    text, text_kwargs = kwargs["text"], {}
+    if isinstance(text, (tuple, list)):
+        if len(text) != 2 or not isinstance(text[1], dict):
+            return None
+        text, text_kwargs = text
+    if not isinstance(text, basestring):
+        return None
+    return text, text_kwargs, options or {}
+
+
+def join(texts, options):
+    """
+    Join messages into one, one per line.
+    """
+    if options.get("client_raw"):
+        # HTML for the webclient, which won't turn newlines into breaks
+        return "<br>".join(texts)
+    if options.get("raw"):
+        # already rendered, including the color reset at the end
+        return "\n".join(texts)
+    # end each message with a color reset, like the Portal does for each
+    # message sent on its own
+    return "\n".join([text + ("||n" if text.endswith("|") else "|n") for text in texts[:-1]] + texts[-1:])
+
+
+def saved_frames():
+    """
+    Get how many frames coalescing saved since the server started.
+    """
+    return STATS["messages"] - STATS["frames"]
+
+
+class OutputBuffer(object):
+    """
+    Text waiting to be sent to one session.
+    """
+    def __init__(self, send):
+        """
+        Args:
+            send (callable): Sends output on, taking `data_out` keywords.
+        """
+        self.send = send
+        self.texts = []
+        self.kwargs = None
+        self.call = None
+
+    def add(self, text, text_kwargs, options):
+        """
+        Buffer a message, flushing what's buffered first if it renders
+        differently.
+        """
+        if self.texts and self.kwargs != (text_kwargs, options):
+            self.flush()
+        self.kwargs = (text_kwargs, options)
+        self.texts.append(text)
+        STATS["messages"] += 1
+        if len(self.texts) >= MAX_BUFFERED:
+            self.flush()
+        elif not self.call:
+            self.call = reactor.callLater(settings.SESSION_OUTPUT_COALESCE_WINDOW / 1000.0, self.flush)
+
+    def flush(self):
+        """
+        Send everything buffered as one message.
+        """
+        if self.call and self.call.active():
+            self.call.cancel()
+        self.call = None
+        if not self.texts:
+            return
+        texts, (text_kwargs, options) = self.texts, self.kwargs
+        self.texts, self.kwargs = [], None
+        STATS["frames"] += 1
+        self.send(text=(join(texts, options), text_kwargs), options=options or None)
@@ -0,0 +1,10 @@
+"""
+Page system
+
+Support code for the `page`/`pages` commands found in
+`commands/default/comms.py`. The page commands only deal with parsing
+and presentation; the modules in this package deal with storing and
+looking up the `Msg` objects behind them without walking an account's
+whole message history.
+
+"""
@@ -0,0 +1,180 @@
+"""
+Page archive
+
+Moves old pages out of the `Msg` table into compressed archive files so
+the hot table, and every sender/receiver lookup on it, stays small.
+
+Archived pages are written as gzipped JSON lines, one file per account
+and month:
+
+    <PAGE_ARCHIVE_DIR>/<YYYY-MM>/<account id>.jsonl.gz
+
+A page is written to the file of its sender and of each receiver that
+has not hidden it, so reading an account's archive never touches anyone
+else's pages. Files are only ever appended to (each append adds a new
+gzip member), by a worker thread, and the `Msg` rows are deleted after
+the files are written. If the server stops in between, the next run
+archives the same pages again; readers drop the duplicates by id.
+Archived pages are taken out of the unread inboxes and local search
+indexes of everyone involved.
+
+Archiving deletes pages from the database, so it is off unless
+PAGE_ARCHIVE_AGE is set. It is run by
+`typeclasses.scripts.PageArchiveScript`.
+
+"""
+import gzip
+import json
+import os
+import re
+from collections import defaultdict, namedtuple
+from datetime import datetime, timedelta
+from django.conf import settings
+from django.utils import timezone
+from twisted.internet import defer, threads
+from evennia.comms.models import Msg
+from evennia.utils import logger
+from world.pages import search, tracking
+
+# An archived page, with the names of its senders and receivers
+ArchivedPage = namedtuple("ArchivedPage", "id date_created senders receivers message")
+
+_SENDER_THROUGH = Msg.db_sender_accounts.through
+_DATE_FORMAT = "%Y-%m-%dT%H:%M:%S.%f"
+_RE_MONTH = re.compile(r"^\d{4}-\d{2}$")
+_RUNNING = []
+
+
+def _month(date):
+    return date.strftime("%Y-%m")
+
+
+def _archive_path(month, account_id):
+    return os.path.join(settings.PAGE_ARCHIVE_DIR, month, "%i.jsonl.gz" % account_id)
+
+
+def _write_records(records):
+    """
+    Append records to the archive files. Runs in a worker thread.
+    """
+    for (month, account_id), lines in records.items():
+        path = _archive_path(month, account_id)
+        if not os.path.isdir(os.path.dirname(path)):
+            os.makedirs(os.path.dirname(path))
+        with gzip.open(path, "ab") as archive_file:
+            archive_file.write(("\n".join(lines) + "\n").encode("utf-8"))
+
+
+def archive_old_pages(batch_size=None):
+    """
+    Archive one batch of pages older than `settings.PAGE_ARCHIVE_AGE` days.
+    Does nothing while the previous batch is still being archived.
+
+    Args:
+        batch_size (int, optional): Most pages to archive in this call.
+            Defaults to `settings.PAGE_ARCHIVE_BATCH_SIZE`.
+
+    Returns:
+        deferred (Deferred): Fires with the number of pages archived once
+            the batch is written and deleted.
+    """
+    if _RUNNING or not settings.PAGE_ARCHIVE_AGE:
+        return defer.succeed(0)
+    batch_size = batch_size or settings.PAGE_ARCHIVE_BATCH_SIZE
+    cutoff = timezone.now() - timedelta(days=settings.PAGE_ARCHIVE_AGE)
+    pages = list(Msg.objects.filter(id__in=_SENDER_THROUGH.objects.values("msg_id"),
+                                    db_date_created__lt=cutoff,
+                                    db_receivers_channels__isnull=True)
+                            .order_by("db_date_created", "id")
+                            .prefetch_related("db_sender_accounts", "db_receivers_accounts",
+                                              "db_hide_from_accounts")[:batch_size])
+    if not pages:
+        return defer.succeed(0)
+
+    records = defaultdict(list)
+    involved = {}
+    page_senders = {}
+    for page in pages:
+        senders = list(page.db_sender_accounts.all())
+        page_senders[page.id] = senders[0].id if senders else None
+        receivers = list(page.db_receivers_accounts.all())
+        hidden = set(account.id for account in page.db_hide_from_accounts.all())
+        record = json.dumps({"id": page.id,
+                             "date": page.db_date_created.strftime(_DATE_FORMAT),
+                             "senders": [account.key for account in senders],
+                             "receivers": [account.key for account in receivers],
+                             "message": page.db_message})
+        for account in senders + receivers:
+            involved[account.id] = account
+            if account.id not in hidden:
+                records[(_month(page.db_date_created), account.id)].append(record)
+
+    _RUNNING.append(True)
+    deferred = threads.deferToThread(_write_records, records)
+    deferred.addCallback(_records_written, page_senders, list(involved.values()), cutoff)
+    deferred.addErrback(_archive_failed)
+    deferred.addBoth(_archive_done)
+    return deferred
+
+
+def _records_written(result, page_senders, accounts, cutoff):
+    """
+    Delete the archived pages, and forget them in the inboxes and search
+    indexes that still refer to them.
+    """
+    ids = set(page_senders)
+    Msg.objects.filter(id__in=ids).delete()
+    for account in accounts:
+        tracking.discard_unread(account, page_senders)
+        search.unindex_pages(account, ids)
+    logger.log_info("Archived %i pages older than %s." % (len(ids), cutoff.date()))
+    return len(ids)
+
+
+def _archive_failed(failure):
+    logger.log_err("Could not write the page archive, will retry: %s" % failure.getErrorMessage())
+    return 0
+
+
+def _archive_done(result):
+    del _RUNNING[:]
+    return result
+
+
+def archived_months(account):
+    """
+    List the months for which an account has archived pages.
+
+    Returns:
+        months (list): `YYYY-MM` strings, oldest first.
+    """
+    if not os.path.isdir(settings.PAGE_ARCHIVE_DIR):
+        return []
+    return sorted(month for month in os.listdir(settings.PAGE_ARCHIVE_DIR)
+                  if os.path.exists(_archive_path(month, account.id)))
+
+
+def archived_pages(account, month):
+    """
+    Read an account's archived pages for a month.
+
+    Args:
+        account (Account): The account whose archive to read.
+        month (str): A `YYYY-MM` month.
+
+    Returns:
+        pages (list): `ArchivedPage` tuples, with the senders and receivers
+            as account names, oldest first.
+    """
+    if not _RE_MONTH.match(month):
+        return []
+    path = _archive_path(month, account.id)
+    if not os.path.exists(path):
+        return []
+    pages = {}
+    with gzip.open(path, "rb") as archive_file:
+        for line in archive_file:
+            record = json.loads(line.decode("utf-8"))
+            pages[record["id"]] = ArchivedPage(record["id"], datetime.strptime(record["date"], _DATE_FORMAT),
+                                               record["senders"], record["receivers"], record["message"])
+    return sorted(pages.values(), key=lambda page: (page.date_created, page.id))
@@ -0,0 +1,146 @@
+"""
+Page history
+
+Database-side lookups of the pages an account has sent and received.
+
+Pages are `Msg` objects with account senders/receivers. Evennia's
+`Msg.objects.get_messages_by_sender/receiver` return an account's
+entire history as lists, which the `pages` command used to concatenate
+and sort in Python. The helpers here instead issue two ordered, limited
+queries, one for the pages sent and one for the pages received, each
+walking the account's rows in the through table index, and merge them.
+They support keyset (cursor) pagination for paging back through older
+history. (A single query for "sent or received" makes most planners
+scan the whole message table by date instead, however few pages the
+account has.)
+
+benchmarks/page_history.py shows the query plans and timings.
+
+The composite indexes the queries rely on are created idempotently by
+`ensure_indexes()`, called from `at_server_start`.
+
+"""
+from django.db import connection
+from django.db.models import Q
+from evennia.comms.models import Msg
+from evennia.utils import logger
+
+# Default number of pages shown by `pages`
+DEFAULT_PAGE_COUNT = 5
+
+# (index name, table, columns)
+_INDEXES = (
+    ("pages_sender_account_msg", Msg.db_sender_accounts.through._meta.db_table, ("accountdb_id", "msg_id")),
+    ("pages_receiver_account_msg", Msg.db_receivers_accounts.through._meta.db_table, ("accountdb_id", "msg_id")),
+    ("pages_msg_date_id", Msg._meta.db_table, ("db_date_created", "id")),
+)
+
+
+def ensure_indexes():
+    """
+    Create the composite indexes used by the page history queries if they
+    do not exist yet. Safe to call on every server start.
+    """
+    quote = connection.ops.quote_name
+    try:
+        with connection.cursor() as cursor:
+            for name, table, columns in _INDEXES:
+                cursor.execute("CREATE INDEX IF NOT EXISTS %s ON %s (%s)" %
+                               (quote(name), quote(table), ", ".join(quote(col) for col in columns)))
+    except Exception:
+        logger.log_trace("Could not create page history indexes.")
+
+
+def sent_queryset(account):
+    """
+    All pages sent by an account, newest first.
+
+    Args:
+        account (Account): The sender.
+
+    Returns:
+        queryset (QuerySet): Unevaluated `Msg` queryset.
+    """
+    return Msg.objects.filter(db_sender_accounts=account, db_receivers_channels__isnull=True) \
+                      .exclude(db_hide_from_accounts=account) \
+                      .order_by("-db_date_created", "-id")
+
+
+def received_queryset(account):
+    """
+    All pages received by an account, newest first.
+
+    Args:
+        account (Account): The receiver.
+
+    Returns:
+        queryset (QuerySet): Unevaluated `Msg` queryset.
+    """
+    return Msg.objects.filter(db_receivers_accounts=account, db_receivers_channels__isnull=True) \
+                      .exclude(db_hide_from_accounts=account) \
+                      .order_by("-db_date_created", "-id")
+
+
+def page_queryset(account):
+    """
+    All pages sent or received by an account, newest first. Meant for
+    going through all of them; use `latest_pages` to get the newest few.
+
+    Args:
+        account (Account): The account whose pages to look up.
+
+    Returns:
+        queryset (QuerySet): Unevaluated `Msg` queryset.
+    """
+    sent = Msg.db_sender_accounts.through.objects.filter(accountdb=account).values("msg_id")
+    received = Msg.db_receivers_accounts.through.objects.filter(accountdb=account).values("msg_id")
+    return Msg.objects.filter(Q(id__in=sent) | Q(id__in=received),
+                              db_receivers_channels__isnull=True) \
+                      .exclude(db_hide_from_accounts=account) \
+                      .order_by("-db_date_created", "-id")
+
+
+def latest_pages(account, number=DEFAULT_PAGE_COUNT, cursor=None):
+    """
+    Get the newest pages of an account, optionally older than a cursor.
+
+    Args:
+        account (Account): The account whose pages to look up.
+        number (int): Maximum number of pages to return.
+        cursor (tuple, optional): A `(date_created, id)` cursor as returned
+            by this function. Only pages older than the cursor are returned.
+
+    Returns:
+        pages, cursor (tuple): The pages in chronological order and the
+            cursor to pass to get the pages before them. The cursor is
+            `None` if there are no older pages.
+    """
+    # fetch one extra row to know if there is anything left past this batch
+    newest = {}
+    for queryset in (sent_queryset(account), received_queryset(account)):
+        if cursor:
+            date, msg_id = cursor
+            queryset = queryset.filter(Q(db_date_created__lt=date) | Q(db_date_created=date, id__lt=msg_id))
+        # pages to oneself are both sent and received
+        newest.update((page.id, page) for page in queryset[:number + 1])
+    pages = sorted(newest.values(), key=lambda page: (page.db_date_created, page.id), reverse=True)
+    pages = pages[:number + 1]
+    older = None
+    if len(pages) > number:
+        pages = pages[:number]
+        older = (pages[-1].db_date_created, pages[-1].id)
+    pages.reverse()
+    return pages, older
+
+
+def last_sent_page(account):
+    """
+    Get the newest page sent by an account.
+
+    Args:
+        account (Account): The sender.
+
+    Returns:
+        page (Msg or None): The last page sent, if any.
+    """
+    return sent_queryset(account).first()
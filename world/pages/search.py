@@ -0,0 +1,144 @@
+"""
+Page search
+
+Ranked full-text search over an account's page history, for
+`pages/search`.
+
+On PostgreSQL the search runs in the database against a GIN index on
+the page text's tsvector, created by `ensure_search_index()` at server
+start. Other backends (the SQLite development setup) use an in-memory
+inverted index per account, built from the account's pages the first
+time they search and kept up to date as they send and receive pages.
+
+"""
+import re
+from collections import defaultdict
+from django.db import connection
+from evennia.comms.models import Msg
+from evennia.utils import logger
+from world.pages import history
+
+# Search configuration used for the tsvector index and the queries.
+SEARCH_CONFIG = "english"
+# Number of matches shown per page of search results
+RESULTS_PER_PAGE = 10
+
+_INDEX_NAME = "pages_msg_message_fts"
+_TSVECTOR = "to_tsvector('%s', %s)" % (SEARCH_CONFIG, connection.ops.quote_name("db_message"))
+_RE_WORD = re.compile(r"\w+", re.U)
+
+
+def _use_database():
+    return connection.vendor == "postgresql"
+
+
+def ensure_search_index():
+    """
+    Create the full-text index on PostgreSQL if it does not exist yet.
+    Safe to call on every server start.
+    """
+    if not _use_database():
+        return
+    try:
+        with connection.cursor() as cursor:
+            cursor.execute("CREATE INDEX IF NOT EXISTS %s ON %s USING GIN (%s)" %
+                           (connection.ops.quote_name(_INDEX_NAME),
+                            connection.ops.quote_name(Msg._meta.db_table), _TSVECTOR))
+    except Exception:
+        logger.log_trace("Could not create the page search index.")
+
+
+def _words(text):
+    return _RE_WORD.findall(text.lower())
+
+
+class LocalPageIndex(object):
+    """
+    Inverted index over one account's pages: word -> {msg id: count}.
+    """
+    def __init__(self, account):
+        self.postings = defaultdict(dict)
+        for page in history.page_queryset(account).only("id", "db_message").iterator():
+            self.add(page.id, page.db_message)
+
+    def add(self, msg_id, text):
+        for word in _words(text):
+            self.postings[word][msg_id] = self.postings[word].get(msg_id, 0) + 1
+
+    def remove(self, msg_ids):
+        """
+        Drop pages from the index.
+        """
+        for word in list(self.postings):
+            postings = self.postings[word]
+            for msg_id in msg_ids.intersection(postings):
+                del postings[msg_id]
+            if not postings:
+                del self.postings[word]
+
+    def search(self, terms):
+        """
+        Get the ids of the pages containing every term, best match first.
+        """
+        words = _words(terms)
+        if not words:
+            return []
+        matches = None
+        for word in words:
+            ids = set(self.postings.get(word, ()))
+            matches = ids if matches is None else matches & ids
+        return sorted(matches, key=lambda msg_id: (-sum(self.postings[word][msg_id] for word in words), -msg_id))
+
+
+def index_page(account, msg_id, text):
+    """
+    Add a newly stored page to an account's local index, if one has been
+    built. Not needed on PostgreSQL.
+    """
+    local_index = account.ndb.page_search_index
+    if local_index:
+        local_index.add(msg_id, text)
+
+
+def unindex_pages(account, msg_ids):
+    """
+    Drop pages that no longer exist (archived or deleted) from an account's
+    local index, if one has been built.
+
+    Args:
+        account (Account): The account.
+        msg_ids (set): Ids of the pages gone.
+    """
+    local_index = account.ndb.page_search_index
+    if local_index:
+        local_index.remove(msg_ids)
+
+
+def search_pages(account, terms, page=1):
+    """
+    Search an account's pages.
+
+    Args:
+        account (Account): The account whose pages to search.
+        terms (str): Words that must all be in the page.
+        page (int): Which page of `RESULTS_PER_PAGE` results to get.
+
+    Returns:
+        matches, total (tuple): The matching pages, best first, and the
+            total number of matches.
+    """
+    start = (page - 1) * RESULTS_PER_PAGE
+    if _use_database():
+        queryset = history.page_queryset(account).extra(
+            select={"rank": "ts_rank(%s, plainto_tsquery(%%s, %%s))" % _TSVECTOR},
+            select_params=(SEARCH_CONFIG, terms),
+            where=["%s @@ plainto_tsquery(%%s, %%s)" % _TSVECTOR],
+            params=(SEARCH_CONFIG, terms)).order_by("-rank", "-db_date_created", "-id")
+        return list(queryset[start:start + RESULTS_PER_PAGE]), queryset.count()
+
+    local_index = account.ndb.page_search_index
+    if not local_index:
+        local_index = account.ndb.page_search_index = LocalPageIndex(account)
+    ids = local_index.search(terms)
+    pages = Msg.objects.in_bulk(ids[start:start + RESULTS_PER_PAGE])
+    return [pages[msg_id] for msg_id in ids[start:start + RESULTS_PER_PAGE] if msg_id in pages], len(ids)
@@ -0,0 +1,299 @@
+"""
+Page store
+
+Persistence of page messages. By default each page is written with
+`create.create_message` before it is delivered. With
+`settings.PAGE_WRITE_BEHIND` enabled, pages are instead queued in memory
+and bulk inserted by a worker thread every
+`settings.PAGE_WRITE_BEHIND_INTERVAL` seconds, or as soon as
+`settings.PAGE_WRITE_BEHIND_BATCH_SIZE` pages are waiting, so sending a
+page never waits on the database.
+
+Anything still queued is written synchronously by `stop()`, which the
+server calls as it stops for a reload or shutdown. A batch that fails
+to write is put back in front of the queue, never dropped. A batch is
+only put back once its write is known to have failed, never while a
+worker thread may still commit it.
+
+Commands reading page history first wait for the queue with
+`flush_pending()`, which returns a Deferred: it writes what is queued
+right away, unless a worker thread is writing a batch, in which case it
+fires once that batch and everything queued behind it is written. The
+reactor never waits on a worker thread, except in `stop()`.
+
+Once a page is written, it is added to the unread inbox of the receivers
+that were offline when it was delivered, and to the local search index
+of everyone involved, and the sender's last page record is saved (see
+`tracking.save_sent`).
+
+"""
+import threading
+from django.conf import settings
+from django.db import close_old_connections, connection, transaction
+from twisted.internet import defer, task, threads
+from evennia.comms.models import Msg
+from evennia.utils import create, logger
+from world.pages import search, tracking
+
+_SENDER_THROUGH = Msg.db_sender_accounts.through
+_RECEIVER_THROUGH = Msg.db_receivers_accounts.through
+
+# Seconds stop() waits for a batch being written by a worker thread
+INFLIGHT_WAIT = 30
+
+
+def _can_bulk_return_ids():
+    """
+    Bulk inserts only hand back primary keys on some backends (PostgreSQL),
+    and we need them to link senders and receivers.
+    """
+    features = connection.features
+    return getattr(features, "can_return_ids_from_bulk_insert",
+                   getattr(features, "can_return_rows_from_bulk_insert", False))
+
+
+def _write_batch(batch):
+    """
+    Insert a batch of queued pages.
+
+    Args:
+        batch (list): `(sender, message, receivers, offline)` tuples.
+    """
+    with transaction.atomic():
+        if _can_bulk_return_ids():
+            msgs = Msg.objects.bulk_create([Msg(db_message=message) for _, message, _, _ in batch])
+        else:
+            msgs = [Msg(db_message=message) for _, message, _, _ in batch]
+            for msg in msgs:
+                msg.save()
+        _SENDER_THROUGH.objects.bulk_create(
+            [_SENDER_THROUGH(msg_id=msg.id, accountdb_id=sender.id)
+             for msg, (sender, _, _, _) in zip(msgs, batch)])
+        _RECEIVER_THROUGH.objects.bulk_create(
+            [_RECEIVER_THROUGH(msg_id=msg.id, accountdb_id=receiver.id)
+             for msg, (_, _, receivers, _) in zip(msgs, batch) for receiver in receivers])
+    return msgs
+
+
+def _page_written(msg, sender, receivers, offline):
+    """
+    Update the per-account page records once a page has been stored.
+    """
+    for receiver in offline:
+        tracking.add_unread(receiver, sender, msg.id)
+    for account in [sender] + list(receivers):
+        search.index_page(account, msg.id, msg.db_message)
+
+
+def _batch_written(msgs, batch):
+    last_sent = {}
+    for msg, (sender, message, receivers, offline) in zip(msgs, batch):
+        _page_written(msg, sender, receivers, offline)
+        last_sent[sender.id] = (sender, receivers, message)
+    for sender, receivers, message in last_sent.values():
+        tracking.save_sent(sender, receivers, message)
+
+
+class _InFlight(object):
+    """
+    A batch handed to a worker thread. `done` is set by the thread itself,
+    so `stop()` can wait for it without the reactor running.
+    """
+    def __init__(self, batch):
+        self.batch = batch
+        self.done = threading.Event()
+        self.msgs = None
+        self.failed = False
+        self.handled = False
+
+
+def _write_batch_in_thread(inflight):
+    """
+    Worker thread entry point; threads keep their own database connection.
+    """
+    try:
+        close_old_connections()
+        inflight.msgs = _write_batch(inflight.batch)
+        return inflight.msgs
+    except Exception:
+        # the transaction was rolled back
+        inflight.failed = True
+        raise
+    finally:
+        inflight.done.set()
+
+
+class PageWriteQueue(object):
+    """
+    In-memory queue of pages waiting to be written to the database.
+    """
+    def __init__(self, interval, batch_size):
+        self.interval = interval
+        self.batch_size = batch_size
+        self.pending = []
+        self.inflight = None
+        self.waiting = []
+        self.task = None
+
+    def start(self):
+        """
+        Start flushing the queue on an interval.
+        """
+        if not self.task:
+            self.task = task.LoopingCall(self.flush)
+            self.task.start(self.interval, now=False)
+
+    def stop(self):
+        """
+        Stop the flush timer and write everything still queued. A batch a
+        worker thread is writing is waited for, blocking the reactor as it
+        stops; if it failed it is written again here.
+        """
+        if self.task and self.task.running:
+            self.task.stop()
+        self.task = None
+        inflight = self.inflight
+        if inflight and not inflight.handled:
+            inflight.done.wait(INFLIGHT_WAIT)
+            if inflight.msgs is not None:
+                inflight.handled = True
+                _batch_written(inflight.msgs, inflight.batch)
+            elif inflight.failed:
+                inflight.handled = True
+                self.pending[:0] = inflight.batch
+            else:
+                logger.log_err("%i pages were still being written when stopping; they may not be "
+                               "stored." % len(inflight.batch))
+        self.write_pending()
+        if self.pending:
+            logger.log_err("%i queued pages could not be written before stopping." % len(self.pending))
+        self._settle()
+
+    def add(self, sender, message, receivers, offline=()):
+        """
+        Queue a page for writing.
+        """
+        self.pending.append((sender, message, list(receivers), list(offline)))
+        if len(self.pending) >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        """
+        Hand the queued pages to a worker thread to write, unless one is
+        writing already.
+        """
+        if not self.pending or self.inflight:
+            return
+        if not _can_bulk_return_ids():
+            self.write_pending()
+            return
+        batch, self.pending = self.pending, []
+        inflight = self.inflight = _InFlight(batch)
+        deferred = threads.deferToThread(_write_batch_in_thread, inflight)
+        deferred.addCallbacks(self._written, self._requeue, callbackArgs=(inflight,), errbackArgs=(inflight,))
+        deferred.addBoth(self._done, inflight)
+
+    def write_pending(self):
+        """
+        Write the queued pages synchronously on the calling thread. A
+        batch that fails is put back in front of the queue.
+        """
+        if not self.pending:
+            return
+        batch, self.pending = self.pending, []
+        try:
+            msgs = _write_batch(batch)
+        except Exception:
+            logger.log_trace("Could not write %i queued pages, keeping them queued." % len(batch))
+            self.pending[:0] = batch
+            return
+        _batch_written(msgs, batch)
+
+    def settled(self):
+        """
+        Get a Deferred firing once the pages queued so far are written.
+        They are written right away, unless a worker thread is writing a
+        batch; then the queue is written once it is done.
+        """
+        if self.inflight:
+            deferred = defer.Deferred()
+            self.waiting.append(deferred)
+            return deferred
+        self.write_pending()
+        return defer.succeed(None)
+
+    def _settle(self):
+        waiting, self.waiting = self.waiting, []
+        for deferred in waiting:
+            deferred.callback(None)
+
+    def _written(self, msgs, inflight):
+        if not inflight.handled:
+            inflight.handled = True
+            _batch_written(msgs, inflight.batch)
+
+    def _requeue(self, failure, inflight):
+        """
+        Put a failed batch back in front of the queue to retry next flush.
+        """
+        if not inflight.handled:
+            inflight.handled = True
+            logger.log_err("Could not write %i queued pages, retrying: %s"
+                           % (len(inflight.batch), failure.getErrorMessage()))
+            self.pending[:0] = inflight.batch
+
+    def _done(self, result, inflight):
+        if self.inflight is inflight:
+            self.inflight = None
+        if self.waiting and not self.inflight:
+            self.write_pending()
+            self._settle()
+
+
+PAGE_QUEUE = PageWriteQueue(settings.PAGE_WRITE_BEHIND_INTERVAL, settings.PAGE_WRITE_BEHIND_BATCH_SIZE)
+
+
+def start():
+    """
+    Start the write-behind queue if it is enabled. Called at server start.
+    """
+    if settings.PAGE_WRITE_BEHIND:
+        PAGE_QUEUE.start()
+
+
+def stop():
+    """
+    Stop the write-behind queue and synchronously write every queued page.
+    Called when the server stops for a reload or shutdown.
+    """
+    PAGE_QUEUE.stop()
+
+
+def flush_pending():
+    """
+    Write every queued page before reading history.
+
+    Returns:
+        deferred (Deferred): Fires once every page queued so far is
+            written (right away if no worker thread is writing).
+    """
+    return PAGE_QUEUE.settled()
+
+
+def persist_page(sender, message, receivers, offline=()):
+    """
+    Store a page, either right away or through the write-behind queue.
+
+    Args:
+        sender (Account): The account sending the page.
+        message (str): The page text to store.
+        receivers (list): The accounts paged.
+        offline (list, optional): The receivers that were offline, whose
+            unread inbox the page should be added to.
+    """
+    if settings.PAGE_WRITE_BEHIND:
+        PAGE_QUEUE.add(sender, message, receivers, offline)
+    else:
+        msg = create.create_message(sender, message, receivers=receivers)
+        _page_written(msg, sender, receivers, offline)
+        tracking.save_sent(sender, receivers, message)
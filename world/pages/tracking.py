@@ -0,0 +1,144 @@
+"""
+Page tracking
+
+Per-account records maintained as pages are created, so that the page
+command can answer "who did I last page, and what did I say" and "what
+did I miss while offline" without querying the account's message
+history.
+
+The last page sent is kept in `ndb.last_page` of the sending account as
+soon as it is sent, and saved to its `last_page` Attribute once the page
+is stored, which with write-behind happens off the page's delivery (see
+`world.pages.store`). Accounts that have not paged since this was
+introduced get their record seeded from a single query for their newest
+sent page.
+
+Pages received while offline are added to the `page_inbox` Attribute
+of the receiver: an unread counter, per-sender counts and the ids of the
+unread `Msg` objects (the newest `MAX_INBOX_IDS` of them).
+
+"""
+from evennia.comms.models import Msg
+from world.pages import history
+
+# Most unread page ids kept per inbox; the counters keep counting past it.
+MAX_INBOX_IDS = 500
+
+
+def record_sent(sender, receivers, message):
+    """
+    Remember the last page sent by an account, in memory. Call this once
+    the page has been handed to the store.
+
+    Args:
+        sender (Account): The account that sent the page.
+        receivers (list): The accounts paged.
+        message (str): The message as it is stored.
+    """
+    sender.ndb.last_page = {"receivers": list(receivers), "message": message}
+
+
+def save_sent(sender, receivers, message):
+    """
+    Save the last page sent by an account to its Attribute. Called by the
+    store once the page is written.
+    """
+    sender.db.last_page = {"receivers": list(receivers), "message": message}
+
+
+def last_page(account):
+    """
+    Get the last page sent by an account.
+
+    Args:
+        account (Account): The sender.
+
+    Returns:
+        receivers, message (tuple): The accounts last paged and the message
+            sent to them, or `(None, None)` if the account never paged anyone.
+    """
+    record = account.ndb.last_page or account.db.last_page
+    if record is None:
+        page = history.last_sent_page(account)
+        if not page:
+            return None, None
+        save_sent(account, page.receivers, page.message)
+        record = account.db.last_page
+    account.ndb.last_page = record
+    # accounts deleted since the page was sent unpack as None
+    receivers = [receiver for receiver in record["receivers"] if receiver]
+    return receivers, record["message"]
+
+
+def add_unread(receiver, sender, msg_id):
+    """
+    Add a page to an account's unread inbox. Call this once the page has
+    been created for a receiver that was offline.
+
+    Args:
+        receiver (Account): The account paged.
+        sender (Account): The account that sent the page.
+        msg_id (int): Id of the stored page.
+    """
+    inbox = receiver.db.page_inbox or {"count": 0, "senders": {}, "ids": []}
+    inbox["count"] += 1
+    inbox["senders"][sender.id] = inbox["senders"].get(sender.id, 0) + 1
+    inbox["ids"] = (inbox["ids"] + [msg_id])[-MAX_INBOX_IDS:]
+    receiver.db.page_inbox = inbox
+
+
+def unread_count(account):
+    """
+    Get the size of an account's unread inbox.
+
+    Returns:
+        count, senders (tuple): The number of unread pages and the number
+            of different accounts they came from.
+    """
+    inbox = account.db.page_inbox
+    if not inbox:
+        return 0, 0
+    return inbox["count"], len(inbox["senders"])
+
+
+def pop_unread(account):
+    """
+    Get the unread pages of an account and mark them read.
+
+    Returns:
+        pages (list): The unread pages still in the database, oldest first.
+    """
+    inbox = account.db.page_inbox
+    if not inbox:
+        return []
+    del account.db.page_inbox
+    return list(Msg.objects.filter(id__in=inbox["ids"]).order_by("db_date_created", "id"))
+
+
+def discard_unread(account, senders):
+    """
+    Take pages that no longer exist (archived or deleted) out of an
+    account's unread inbox.
+
+    Args:
+        account (Account): The account.
+        senders (dict): The pages gone, as `{msg id: sender id}`.
+    """
+    inbox = account.db.page_inbox
+    if not inbox:
+        return
+    gone = [msg_id for msg_id in inbox["ids"] if msg_id in senders]
+    if not gone:
+        return
+    for msg_id in gone:
+        inbox["count"] -= 1
+        sender_id = senders[msg_id]
+        if sender_id in inbox["senders"]:
+            inbox["senders"][sender_id] -= 1
+            if inbox["senders"][sender_id] <= 0:
+                del inbox["senders"][sender_id]
+    inbox["ids"] = [msg_id for msg_id in inbox["ids"] if msg_id not in senders]
+    if inbox["count"] > 0:
+        account.db.page_inbox = inbox
+    else:
+        del account.db.page_inbox
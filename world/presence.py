@@ -0,0 +1,190 @@
+"""
+Presence
+
+Who is online, in one place. Paging, channel delivery to online
+subscribers, the who list and the connection info channel all need to
+know if accounts are connected; asking each account for its sessions
+costs a lookup per account every time.
+
+The presence service keeps the ids of the accounts and characters with
+connected sessions in memory, updated by the session and character
+hooks:
+
+- `ServerSession.at_login` / `at_disconnect` -> `login()` / `logout()`
+- `ServerSession.at_sync` (sessions coming back after a reload) -> `sync()`
+- `Character.at_post_puppet` / `at_post_unpuppet` -> `puppeted()` /
+  `unpuppeted()`
+
+Membership tests are dict lookups and bulk queries are set
+intersections. Last activity and idle times come from the sessions'
+own `cmd_last_visible`. `version()` changes whenever anything does, for
+caches built on top (like the who list).
+
+"""
+import time
+
+_SESSIONS = {}
+_ACCOUNTS = {}
+_CHARACTERS = {}
+_PUPPETS = {}
+_STATE = {"version": 0}
+
+
+def _changed():
+    _STATE["version"] += 1
+
+
+def _add(index, key, sessid):
+    index.setdefault(key, set()).add(sessid)
+
+
+def _discard(index, key, sessid):
+    sessids = index.get(key)
+    if sessids is not None:
+        sessids.discard(sessid)
+        if not sessids:
+            del index[key]
+
+
+def login(session):
+    """
+    Register a session that logged in.
+    """
+    _SESSIONS[session.sessid] = session
+    _add(_ACCOUNTS, session.account.id, session.sessid)
+    _changed()
+
+
+def logout(session):
+    """
+    Forget a session that disconnected.
+    """
+    sessid = session.sessid
+    _SESSIONS.pop(sessid, None)
+    # the account id of a logged-in session, kept through the disconnect
+    _discard(_ACCOUNTS, session.uid, sessid)
+    if sessid in _PUPPETS:
+        _discard(_CHARACTERS, _PUPPETS.pop(sessid), sessid)
+    _changed()
+
+
+def sync(session):
+    """
+    Register a session that was resynced after a reload, with its puppet.
+    """
+    if session.logged_in and session.account:
+        login(session)
+        if session.puppet:
+            puppeted(session.puppet, session)
+
+
+def puppeted(character, session=None):
+    """
+    Register a character being puppeted, by the given session or by all its
+    sessions.
+    """
+    sessions = [session] if session else character.sessions.all()
+    for session in sessions:
+        if session.sessid in _PUPPETS:
+            _discard(_CHARACTERS, _PUPPETS[session.sessid], session.sessid)
+        _PUPPETS[session.sessid] = character.id
+        _add(_CHARACTERS, character.id, session.sessid)
+    _changed()
+
+
+def unpuppeted(character, session=None):
+    """
+    Register a character no longer being puppeted by a session, or by any.
+    """
+    sessids = [session.sessid] if session else list(_CHARACTERS.get(character.id, ()))
+    for sessid in sessids:
+        if _PUPPETS.get(sessid) == character.id:
+            del _PUPPETS[sessid]
+        _discard(_CHARACTERS, character.id, sessid)
+    _changed()
+
+
+def version():
+    """
+    Get a number that changes whenever presence does.
+    """
+    return _STATE["version"]
+
+
+def is_online(account_id):
+    """
+    Check if an account has a connected session.
+    """
+    return account_id in _ACCOUNTS
+
+
+def is_puppeted(character_id):
+    """
+    Check if a character is puppeted by a connected session.
+    """
+    return character_id in _CHARACTERS
+
+
+def online_account_ids(account_ids=None):
+    """
+    Get which accounts are online.
+
+    Args:
+        account_ids (iterable, optional): The account ids to check. All online
+            accounts are returned if not given.
+
+    Returns:
+        ids (set): The ids of the online accounts.
+    """
+    if account_ids is None:
+        return set(_ACCOUNTS)
+    return set(account_ids).intersection(_ACCOUNTS)
+
+
+def puppeted_character_ids(character_ids=None):
+    """
+    Get which characters are puppeted.
+
+    Args:
+        character_ids (iterable, optional): The character ids to check. All
+            puppeted characters are returned if not given.
+
+    Returns:
+        ids (set): The ids of the puppeted characters.
+    """
+    if character_ids is None:
+        return set(_CHARACTERS)
+    return set(character_ids).intersection(_CHARACTERS)
+
+
+def sessions():
+    """
+    Get all logged-in sessions.
+    """
+    return list(_SESSIONS.values())
+
+
+def account_count():
+    """
+    Get the number of online accounts.
+    """
+    return len(_ACCOUNTS)
+
+
+def last_activity(account_id):
+    """
+    Get when an online account last did something visible, as a timestamp,
+    or None if it is offline.
+    """
+    times = [_SESSIONS[sessid].cmd_last_visible for sessid in _ACCOUNTS.get(account_id, ())
+             if sessid in _SESSIONS]
+    return max(times) if times else None
+
+
+def idle_time(account_id):
+    """
+    Get how many seconds an online account has been idle, or None if it is
+    offline.
+    """
+    last = last_activity(account_id)
+    return None if last is None else time.time() - last
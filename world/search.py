@@ -0,0 +1,190 @@
+"""
+Bulk search
+
+Resolve several names in one go, for commands that take a list of
+targets (`whisper a, b, c = msg`, `page a, b, c = msg`). Calling
+`caller.search()` once per name repeats the same queries and candidate
+gathering for every name; the functions here gather the candidates (or
+query the accounts) once and match every name against them.
+
+Each name gets a `SearchResult` telling if it matched one target, none,
+or several. Unless told to be quiet, failed names are reported to the
+caller with the same messages as a normal search. Names go through the
+caller's object and account nicks first, and are matched with the same
+rules as `caller.search()`, so both find the same objects.
+
+"""
+import re
+from collections import defaultdict, namedtuple
+from django.conf import settings
+from django.db.models import Q
+from evennia.accounts.models import AccountDB
+from evennia.utils.utils import dbref, string_partial_matching, variable_from_module
+
+MATCH, NOMATCH, MULTIMATCH = "match", "nomatch", "multimatch"
+
+_AT_SEARCH_RESULT = variable_from_module(*settings.SEARCH_AT_RESULT.rsplit(".", 1))
+_RE_MULTIMATCH = re.compile(settings.SEARCH_MULTIMATCH_REGEX, re.I + re.U)
+_SELF_NAMES = ("me", "self")
+_ACCOUNT_SELF_NAMES = ("me", "*me", "self", "*self")
+_HERE_NAMES = ("here",)
+
+
+class SearchResult(namedtuple("SearchResult", "query status matches")):
+    """
+    The outcome of searching for one name.
+
+    query - the name searched for
+    status - MATCH, NOMATCH or MULTIMATCH
+    matches - all the objects matching the name
+    """
+    __slots__ = ()
+
+    @property
+    def obj(self):
+        """
+        The object found, or None unless exactly one object matched.
+        """
+        return self.matches[0] if self.status == MATCH else None
+
+
+def _result(query, matches, index=None):
+    if index is not None and matches:
+        matches = matches[index - 1:index] if 0 < index <= len(matches) else []
+    status = MATCH if len(matches) == 1 else (MULTIMATCH if matches else NOMATCH)
+    return SearchResult(query, status, matches)
+
+
+def _report(caller, results, quiet):
+    if not quiet:
+        for result in results:
+            if result.status != MATCH:
+                _AT_SEARCH_RESULT(result.matches, caller, query=result.query)
+    return results
+
+
+def _split_index(name):
+    """
+    Split a 'name-2' style multimatch reference into its name and index.
+    """
+    match = _RE_MULTIMATCH.match(name)
+    if match:
+        return match.group("name"), int(match.group("number"))
+    return name, None
+
+
+def _partial(name, keys, aliases):
+    """
+    Partially match a name the way Evennia's object search does: against
+    the keys first, then against the aliases containing the name.
+    """
+    indexes = string_partial_matching([key for key, _ in keys], name, ret_index=True)
+    if indexes:
+        return [keys[index][1] for index in indexes]
+    aliases = [(alias, obj) for alias, obj in aliases if name.lower() in alias.lower()]
+    indexes = string_partial_matching([alias for alias, _ in aliases], name, ret_index=True)
+    matches = []
+    for index in indexes:
+        # an object with several matching aliases only counts once
+        if aliases[index][1] not in matches:
+            matches.append(aliases[index][1])
+    return matches
+
+
+def search_many(caller, names, location=None, quiet=False):
+    """
+    Find the objects matching a list of names among the caller's
+    surroundings: the location, its contents and the caller's inventory.
+
+    Each name first has the caller's object and account nicks replaced.
+    It then matches the key or an alias of an object exactly and case
+    insensitively. If nothing matches exactly, a `name-2` multimatch
+    reference is split off, and the name is partially matched against
+    the keys, then against the aliases, with Evennia's
+    `string_partial_matching`. `me`, `self` and `here` are understood,
+    and so is `#dbref` for Builders, as in `caller.search()`.
+
+    Args:
+        caller (Object): The object searching.
+        names (list): Names to look up.
+        location (Object, optional): Where to search. Defaults to the
+            caller's location.
+        quiet (bool, optional): Don't report names that failed to match.
+
+    Returns:
+        results (list): One `SearchResult` per name, in the order of `names`.
+    """
+    location = location or caller.location
+    candidates = list(caller.contents)
+    if location:
+        candidates.extend(location.contents)
+        candidates.append(location)
+    # the database search hands candidates back in id order
+    candidates.sort(key=lambda obj: obj.id)
+    use_dbref = caller.locks.check_lockstring(caller, "_dummy:perm(Builder)")
+
+    exact = defaultdict(list)
+    keys, aliases = [], []
+    by_dbref = {}
+    for obj in candidates:
+        by_dbref[obj.id] = obj
+        keys.append((obj.key, obj))
+        obj_aliases = obj.aliases.all()
+        aliases.extend((alias, obj) for alias in obj_aliases)
+        for name in set([obj.key.lower()] + [alias.lower() for alias in obj_aliases]):
+            exact[name].append(obj)
+
+    results = []
+    for query in names:
+        name = caller.nicks.nickreplace(query.strip(), categories=("object", "account"), include_account=True)
+        lname, index = name.lower(), None
+        if lname in _SELF_NAMES:
+            matches = [caller]
+        elif lname in _HERE_NAMES and location:
+            matches = [location]
+        elif use_dbref and dbref(lname):
+            matches = [by_dbref[dbref(lname)]] if dbref(lname) in by_dbref else []
+        else:
+            matches = exact.get(lname)
+            if not matches:
+                name, index = _split_index(name)
+                matches = _partial(name, keys, aliases)
+        results.append(_result(query, matches, index))
+    return _report(caller, results, quiet)
+
+
+def search_accounts(caller, names, quiet=False):
+    """
+    Find the accounts matching a list of names in a single query.
+
+    Names are matched case-insensitively against account names, after
+    the caller's account nicks are applied, as `Account.search` does;
+    `#dbref` and `me`/`self` are also understood.
+
+    Args:
+        caller (Account): The account searching.
+        names (list): Names to look up.
+        quiet (bool, optional): Don't report names that failed to match.
+
+    Returns:
+        results (list): One `SearchResult` per name, in the order of `names`.
+    """
+    names = [caller.nicks.nickreplace(name.strip(), categories=("account",), include_account=False)
+             for name in names]
+    query = Q()
+    for name in names:
+        query |= Q(id=dbref(name)) if dbref(name) else Q(username__iexact=name)
+    found = {}
+    if query:
+        for account in AccountDB.objects.filter(query):
+            found[account.key.lower()] = account
+            found["#%i" % account.id] = account
+
+    results = []
+    for name in names:
+        if name.lower() in _ACCOUNT_SELF_NAMES:
+            account = caller
+        else:
+            account = found.get(name.lower()) or found.get("#%s" % dbref(name))
+        results.append(_result(name, [account] if account else []))
+    return _report(caller, results, quiet)
@@ -0,0 +1,34 @@
+"""
+Tests for the game's world modules, run with `evennia test .` from the
+game directory.
+
+"""
+from django.test import TestCase
+from world import output
+
+
+class TestOutputBuffer(TestCase):
+
+    def setUp(self):
+        self.sent = []
+        self.buffer = output.OutputBuffer(lambda **kwargs: self.sent.append(kwargs))
+
+    def test_coalesce_text(self):
+        self.buffer.add("Anna waves.", {}, {})
+        self.buffer.add("Bob nods.", {}, {})
+        self.buffer.flush()
+        self.assertEqual(self.sent, [{"text": ("Anna waves.|n\nBob nods.", {}), "options": None}])
+
+    def test_coalesce_raw_webclient(self):
+        options = {"raw": True, "client_raw": True, "screenreader": False}
+        self.buffer.add("<span>Anna waves.</span>", {}, options)
+        self.buffer.add("<span>Bob nods.</span>", {}, options)
+        self.buffer.flush()
+        self.assertEqual(self.sent, [{"text": ("<span>Anna waves.</span><br><span>Bob nods.</span>", {}),
+                                      "options": options}])
+
+    def test_different_options_not_coalesced(self):
+        self.buffer.add("Anna waves.", {}, {})
+        self.buffer.add("<span>Bob nods.</span>", {}, {"raw": True, "client_raw": True})
+        self.buffer.flush()
+        self.assertEqual(len(self.sent), 2)
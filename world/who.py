@@ -0,0 +1,77 @@
+"""
+Who snapshot
+
+The `who` list, shared by everyone who asks for it. Evennia's `who`
+walks all sessions and lays out a fresh table on every call, and it can
+be called from the login screen by anyone.
+
+The list is built from the logged-in sessions kept by `world.presence`.
+The rendered list is cached per view (privileged and public) until
+presence changes (sessions logging in or out, characters being puppeted
+or unpuppeted), or for at most WHO_CACHE_TTL seconds so that the times
+shown stay roughly current.
+
+"""
+import time
+from django.conf import settings
+from evennia.utils import evtable, utils
+from world import presence
+
+PRIVILEGED, PUBLIC = "privileged", "public"
+
+_RENDERED = {}
+
+
+def sessions():
+    """
+    Get the logged-in sessions, sorted by account name.
+    """
+    return sorted((session for session in presence.sessions() if session.logged_in and session.account),
+                  key=lambda session: session.account.key.lower())
+
+
+def _render(view):
+    session_list = sessions()
+    now = time.time()
+    if view == PRIVILEGED:
+        table = evtable.EvTable("|wAccount Name", "|wOn for", "|wIdle", "|wPuppeting", "|wRoom",
+                                "|wCmds", "|wProtocol", "|wHost")
+        for session in session_list:
+            puppet = session.puppet
+            location = puppet.location.key if puppet and puppet.location else "None"
+            table.add_row(utils.crop(session.account.name, width=25),
+                          utils.time_format(now - session.conn_time, 0),
+                          utils.time_format(now - session.cmd_last_visible, 1),
+                          utils.crop(puppet.key if puppet else "None", width=25),
+                          utils.crop(location, width=25),
+                          session.cmd_total,
+                          session.protocol_key,
+                          isinstance(session.address, tuple) and session.address[0] or session.address)
+    else:
+        table = evtable.EvTable("|wAccount name", "|wOn for", "|wIdle")
+        for session in session_list:
+            table.add_row(utils.crop(session.account.key, width=25),
+                          utils.time_format(now - session.conn_time, 0),
+                          utils.time_format(now - session.cmd_last_visible, 1))
+    naccounts = len(set(session.account.id for session in session_list))
+    is_one = naccounts == 1
+    return "|wAccounts:|n\n%s\n%s unique account%s logged in." % (table, "One" if is_one else naccounts,
+                                                                 "" if is_one else "s")
+
+
+def who_list(view):
+    """
+    Get the rendered who list.
+
+    Args:
+        view (str): PRIVILEGED or PUBLIC.
+
+    Returns:
+        text (str): The list, rendered at most WHO_CACHE_TTL seconds ago.
+    """
+    cached = _RENDERED.get(view)
+    version = presence.version()
+    if not cached or cached[0] != version or cached[1] <= time.time():
+        text = _render(view)
+        cached = _RENDERED[view] = (version, time.time() + settings.WHO_CACHE_TTL, text)
+    return cached[2]